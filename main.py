@@ -1,12 +1,43 @@
-from fastapi import FastAPI
+import hashlib
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
 from fastapi.staticfiles import StaticFiles
 
 # Try to import Dev 2 logic (processing layer)
 try:
+    from processing import oil, surface
     from processing.surface import get_surface_health
-    from processing.oil import get_oil_slicks
-    from processing.risk import get_risk_zones
+    from processing.oil import detect_oil_slicks, iter_oil_slicks, slicks_page_json
+    from processing.risk import get_risk_zones_json, iter_risk_zones, query_risk_zones
+    from processing.batch import (
+        get_batch_status,
+        iter_batch_results,
+        shutdown_batch,
+        submit_batch,
+    )
+    from processing.geojson import (
+        GEOJSON_MEDIA_TYPE,
+        NDJSON_MEDIA_TYPE,
+        iter_feature_collection,
+        iter_ndjson,
+        parse_bbox,
+    )
+    from processing.admission import AdmissionController, Overloaded
+    from processing.events import (
+        iter_sse,
+        publish_slicks,
+        publish_surface,
+        subscribe,
+        subscriber_count,
+    )
+    from processing.raster_cache import scene_fingerprint
+    from processing.tiles import MVT_MEDIA_TYPE, encode_tile
 
     DEV2_AVAILABLE = True
 except ImportError:
@@ -29,8 +60,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Age", "X-Cache-Status"],
 )
 
+# Per-endpoint admission control: concurrency cap, bounded queue and
+# stale-while-revalidate fallback for the expensive raster endpoints
+ADMISSION = {
+    "surface-health": AdmissionController("surface-health", max_concurrent=2, max_queue=8),
+    # Pages of one query reuse a single detection for max_age seconds
+    "oil-slicks": AdmissionController("oil-slicks", max_concurrent=2, max_queue=8,
+                                      max_age=30.0),
+} if DEV2_AVAILABLE else {}
+
+# Detection parameters whose results are pushed to /api/events subscribers
+DEFAULT_OIL_OPTIONS = dict(screen=False, detector=None, threshold=None,
+                           clip_percentiles=(0.0, 100.0), crs=None)
+SCENE_POLL_SECONDS = 30.0  # How often scenes are checked for new imagery
+STREAM_FORMATS = ("ndjson", "geojson")
+
 
 # -------------------------------
 # 🩺 Health check
@@ -53,7 +100,8 @@ def surface_health():
     otherwise returns mock data so frontend can keep working.
     """
     if DEV2_AVAILABLE:
-        return get_surface_health()
+        result, _, headers = _admit("surface-health", (), _compute_surface)
+        return JSONResponse(result, headers=headers)
 
     # Fallback mock data
     return {
@@ -77,15 +125,56 @@ def surface_health():
 # 🛢 Oil & Chemical Films (SAR)
 # -------------------------------
 @app.get("/api/oil-slicks")
-def oil_slicks():
+def oil_slicks(
+    screen: bool = False,
+    detector: Optional[str] = None,
+    threshold: Optional[float] = None,
+    clip_low: float = 0.0,
+    clip_high: float = 100.0,
+    crs: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+):
     """
     Oil/chemical film polygons + summary count.
 
-    Uses processing.oil.get_oil_slicks() when available,
-    otherwise returns mock data.
+    Uses processing.oil.detect_oil_slicks() when available,
+    otherwise returns mock data. Pass ?screen=true to screen a
+    decimated overview first and only refine candidate windows, and
+    ?detector=global|local to pick the dark-spot detector (screening
+    requires the global detector).
+    threshold and clip_low/clip_high (percentiles) control normalization.
+    ?crs=EPSG:3857 detects on a cached Web Mercator copy of the scene so
+    polygons line up with web map tiles without client reprojection.
+    Page through results with ?limit= and the returned next_cursor;
+    pages reuse one cached detection (X-Cache-Status: hit), and a cursor
+    from before a scene change is rejected with 400.
+
+    Under load the last good detection for the same parameters is
+    served with X-Cache-Status: stale and an Age header.
     """
     if DEV2_AVAILABLE:
-        return get_oil_slicks()
+        options = dict(
+            screen=screen,
+            detector=detector,
+            threshold=threshold,
+            clip_percentiles=(clip_low, clip_high),
+            crs=crs,
+        )
+        try:
+            # Cursors carry the version of the scene the served table came
+            # from, which under load may be older than the current one
+            table, version, headers = _admit(
+                "oil-slicks",
+                _oil_key(options),
+                lambda: _compute_oil(options),
+                version=_scene_version(oil.SAR_PATH),
+            )
+            page = slicks_page_json(table, limit=limit, cursor=cursor, crs=crs,
+                                    version=version)
+            return Response(page, media_type="application/json", headers=headers)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
     # Fallback mock data
     return {
@@ -124,19 +213,76 @@ def oil_slicks():
     }
 
 
+@app.get("/api/oil-slicks/stream")
+def oil_slicks_stream(
+    screen: bool = False,
+    detector: Optional[str] = None,
+    threshold: Optional[float] = None,
+    clip_low: float = 0.0,
+    clip_high: float = 100.0,
+    crs: Optional[str] = None,
+    fmt: str = Query("ndjson", alias="format"),
+):
+    """
+    Stream every detected slick as it is polygonized.
+
+    ?format=ndjson (default) emits one GeoJSON Feature per line;
+    ?format=geojson emits a single FeatureCollection incrementally.
+    ?crs=EPSG:3857 streams Web Mercator polygons as in /api/oil-slicks.
+    Each stream holds an oil-slicks admission slot until it finishes.
+    """
+    if not DEV2_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Processing layer unavailable")
+    _check_format(fmt)
+    controller = _acquire("oil-slicks")
+    try:
+        try:
+            features = iter_oil_slicks(
+                screen=screen,
+                detector=detector,
+                threshold=threshold,
+                clip_percentiles=(clip_low, clip_high),
+                crs=crs,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        members = {"aoi": "Toronto Harbour"}
+        if crs:
+            members["crs"] = crs
+        return _stream_features(_holding_slot(controller, features), fmt, **members)
+    except BaseException:
+        # The stream owns the slot only once the response is returned
+        controller.release()
+        raise
+
+
 # -------------------------------
 # 💧 Leak / Contamination Risk Zones
 # -------------------------------
 @app.get("/api/risk-zones")
-def risk_zones():
+def risk_zones(
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    bbox: Optional[str] = None,
+):
     """
     Risk polygons with risk_score + category.
 
     Uses processing.risk.get_risk_zones() when available,
-    otherwise returns mock data.
+    otherwise returns mock data. Page through results with ?limit=
+    and the returned next_cursor; ?bbox=minx,miny,maxx,maxy returns
+    only intersecting zones.
     """
     if DEV2_AVAILABLE:
-        return get_risk_zones()
+        try:
+            page = get_risk_zones_json(
+                limit=limit,
+                cursor=cursor,
+                bbox=parse_bbox(bbox) if bbox else None,
+            )
+            return Response(page, media_type="application/json")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
     # Fallback mock data
     return {
@@ -197,4 +343,307 @@ def risk_zones():
                 },
             },
         ],
-    }
\ No newline at end of file
+    }
+
+
+@app.get("/api/risk-zones/stream")
+def risk_zones_stream(
+    bbox: Optional[str] = None,
+    fmt: str = Query("ndjson", alias="format"),
+):
+    """
+    Stream every risk zone (optionally within ?bbox=); see
+    /api/oil-slicks/stream for formats.
+    """
+    if not DEV2_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Processing layer unavailable")
+    try:
+        features = iter_risk_zones(parse_bbox(bbox) if bbox else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _stream_features(features, fmt, aoi="Peel Region Catchment Area")
+
+
+# -------------------------------
+# 🗺 Vector tiles
+# -------------------------------
+TILE_LAYERS = ("oil-slicks", "risk-zones")
+
+
+@app.get("/api/tiles/{layer}/{z}/{x}/{y}.mvt")
+def vector_tile(layer: str, z: int, x: int, y: int):
+    """
+    Mapbox Vector Tile of oil slicks (default detection parameters) or
+    risk zones, for map clients that render tiles instead of GeoJSON.
+    """
+    if not DEV2_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Processing layer unavailable")
+    if layer not in TILE_LAYERS:
+        raise HTTPException(status_code=404, detail=f"Unknown layer {layer!r}, expected one of {TILE_LAYERS}")
+    headers = {}
+    try:
+        if layer == "oil-slicks":
+            table, _, headers = _admit(
+                "oil-slicks",
+                _oil_key(DEFAULT_OIL_OPTIONS),
+                lambda: _compute_oil(DEFAULT_OIL_OPTIONS),
+                version=_scene_version(oil.SAR_PATH),
+            )
+        else:
+            table = query_risk_zones()
+        tile = encode_tile({layer: table}, z, x, y)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(tile, media_type=MVT_MEDIA_TYPE, headers=headers)
+
+
+
+# -------------------------------
+# 🗂 Batch multi-scene analysis
+# -------------------------------
+class BatchJobRequest(BaseModel):
+    scenes: List[str]
+    analyses: List[str] = ["surface", "oil"]
+    options: Dict[str, Any] = {}
+
+
+@app.post("/api/batch-jobs", status_code=202)
+def create_batch_job(request: BatchJobRequest):
+    """
+    Queue surface/oil analyses over a list of scenes under data/.
+
+    Returns a job ID immediately; scenes run in a bounded process pool
+    and keep running if the client disconnects.
+    """
+    if not DEV2_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Processing layer unavailable")
+    try:
+        job_id = submit_batch(request.scenes, request.analyses, request.options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except BrokenProcessPool:
+        raise HTTPException(status_code=503, detail="Batch workers unavailable")
+    return {"job_id": job_id, "status_url": f"/api/batch-jobs/{job_id}"}
+
+
+@app.get("/api/batch-jobs/{job_id}")
+def batch_job_status(job_id: str, include_results: bool = True):
+    """Progress counts and per-scene results finished so far."""
+    status = get_batch_status(job_id, include_results) if DEV2_AVAILABLE else None
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return status
+
+
+@app.get("/api/batch-jobs/{job_id}/results")
+def batch_job_results(job_id: str):
+    """
+    Stream per-scene results as NDJSON in completion order; the
+    response ends when every scene has finished.
+    """
+    if not DEV2_AVAILABLE or get_batch_status(job_id, include_results=False) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return StreamingResponse(
+        iter_ndjson(iter_batch_results(job_id)),
+        media_type=NDJSON_MEDIA_TYPE,
+    )
+
+
+# -------------------------------
+# 📈 Admission metrics
+# -------------------------------
+@app.get("/api/metrics")
+def metrics():
+    """Queue depth, stale-serve and shed counters per admission-controlled endpoint."""
+    return {
+        "admission": {name: controller.stats() for name, controller in ADMISSION.items()}
+    }
+
+
+# -------------------------------
+# 📡 Push updates (Server-Sent Events)
+# -------------------------------
+@app.get("/api/events")
+async def events(
+    request: Request,
+    topics: str = "slicks,surface",
+    bbox: Optional[str] = None,
+    snapshot: bool = True,
+):
+    """
+    Server-Sent Events stream of result deltas.
+
+    Pushes added/changed/removed slicks ("slicks" events) and updated
+    surface metrics ("surface" events) whenever results are republished,
+    limited to ?bbox= if given. A "resync" event means the client fell
+    behind and should refetch over REST.
+    """
+    if not DEV2_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Processing layer unavailable")
+    try:
+        sub = subscribe(
+            topics=[t for t in topics.split(",") if t],
+            bbox=parse_bbox(bbox) if bbox else None,
+            snapshot=snapshot,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        iter_sse(sub, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+_watcher_stop = threading.Event()
+
+
+@app.on_event("startup")
+def startup():
+    if DEV2_AVAILABLE:
+        threading.Thread(target=_watch_scenes, name="scene-watcher", daemon=True).start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    _watcher_stop.set()
+    if DEV2_AVAILABLE:
+        shutdown_batch()
+
+def _stream_features(features, fmt, **members):
+    """Wrap a feature iterator in an NDJSON or GeoJSON streaming response."""
+    _check_format(fmt)
+    if fmt == "ndjson":
+        return StreamingResponse(iter_ndjson(features), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(
+        iter_feature_collection(features, **members),
+        media_type=GEOJSON_MEDIA_TYPE,
+    )
+
+
+def _check_format(fmt):
+    """400 unless fmt is one of STREAM_FORMATS."""
+    if fmt not in STREAM_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown format {fmt!r}, expected one of {STREAM_FORMATS}",
+        )
+
+
+def _holding_slot(controller, items):
+    """Pass items through, releasing the admission slot when done or closed."""
+    try:
+        yield from items
+    finally:
+        controller.release()
+
+
+def _compute_oil(options):
+    """Detect slicks; default-parameter results are published as events."""
+    table = detect_oil_slicks(**options)
+    if options == DEFAULT_OIL_OPTIONS:
+        publish_slicks(table)
+    return table
+
+
+def _compute_surface():
+    result = get_surface_health()
+    publish_surface(result)
+    return result
+
+
+def _watch_scenes():
+    """
+    Recompute and republish results when a scene file changes, as long
+    as someone is subscribed to /api/events.
+    """
+    seen = {}
+    while not _watcher_stop.wait(SCENE_POLL_SECONDS):
+        if not subscriber_count():
+            continue
+        jobs = [
+            (oil.SAR_PATH, "oil-slicks", _oil_key(DEFAULT_OIL_OPTIONS),
+             lambda: _compute_oil(DEFAULT_OIL_OPTIONS), _scene_version(oil.SAR_PATH)),
+            (surface.NDWI_PATH, "surface-health", (), _compute_surface, None),
+        ]
+        for path, endpoint, key, compute, version in jobs:
+            try:
+                fingerprint = scene_fingerprint(path)
+            except OSError:
+                continue
+            if seen.get(path) == fingerprint:
+                continue
+            try:
+                ADMISSION[endpoint].run(key, compute, version=version)
+                seen[path] = fingerprint
+            except Overloaded:
+                pass  # Retry on the next tick
+            except Exception as e:
+                print(f"Warning: refreshing {endpoint} failed: {e}")
+
+
+def _admit(endpoint, key, compute, version=None):
+    """
+    Run compute() under the endpoint's admission controller.
+
+    Args:
+        version: Current version of the endpoint's input (see
+            AdmissionController.run())
+
+    Returns:
+        tuple: (result, version the result was computed from,
+            response headers)
+
+    Raises:
+        HTTPException: 503 with Retry-After when the request is shed
+    """
+    controller = ADMISSION[endpoint]
+    try:
+        result, age, result_version = controller.run(key, compute, version=version)
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    if age is None:
+        return result, result_version, {"X-Cache-Status": "fresh"}
+    hit = result_version == version and age < controller.max_age
+    status = "hit" if hit else "stale"
+    return result, result_version, {"X-Cache-Status": status, "Age": str(int(age))}
+
+
+def _acquire(endpoint):
+    """
+    Take an admission slot for uncached work; 503 when shed.
+
+    Returns:
+        AdmissionController: Call .release() when the work is done
+    """
+    controller = ADMISSION[endpoint]
+    try:
+        controller.acquire()
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    return controller
+
+
+def _oil_key(options):
+    """
+    Admission cache key: detection parameters only, so the last good
+    result survives a scene change as a stale fallback.
+    """
+    return tuple(sorted(options.items()))
+
+
+def _scene_version(path):
+    """Short identifier of a scene file's current contents, or None if missing."""
+    try:
+        fingerprint = scene_fingerprint(path)
+    except OSError:
+        return None
+    return hashlib.sha1(repr(fingerprint).encode()).hexdigest()[:12]
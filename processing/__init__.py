@@ -5,7 +5,14 @@ Contains modules for geospatial data processing:
 - surface.py: NDWI water quality analysis
 - oil.py: SAR oil slick detection
 - risk.py: Contamination risk zone prediction
+- raster_cache.py: Per-scene cached raster statistics
+- geojson.py: Pagination and streaming GeoJSON/NDJSON output
+- features.py: Compact array-backed feature tables
+- batch.py: Multi-scene batch jobs in a process pool
+- admission.py: Concurrency limits and stale-while-revalidate serving
+- events.py: Server-Sent Event delta push to dashboards
+- tiles.py: Mapbox Vector Tile encoding
 """
 
 __version__ = "1.0.0"
-__all__ = ["surface", "oil", "risk"]
+__all__ = ["surface", "oil", "risk", "raster_cache", "geojson", "features", "batch", "admission", "events", "tiles"]
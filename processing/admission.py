@@ -0,0 +1,205 @@
+"""
+processing/admission.py
+
+Admission control for expensive endpoints.
+
+Each AdmissionController caps concurrent computations. Results younger
+than max_age are reused outright, so e.g. successive pages of one query
+share a single computation. When the cap is hit, callers get the last
+good result for their key, flagged as stale, while a single background
+recomputation refreshes it. Results can carry the version of the input
+they were computed from (e.g. a scene fingerprint): an older version is
+never reused as a hit, but is still served as stale under load. Callers
+with no previous result wait in a bounded queue. Once the queue is full or the
+wait times out they are shed with Overloaded, so latency stays bounded
+during ingest spikes.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; carries a Retry-After hint."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is overloaded, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency limit + bounded queue + stale-while-revalidate cache.
+
+    Args:
+        name: Label used in errors and stats
+        max_concurrent: Computations allowed to run at once
+        max_queue: Callers allowed to wait when no stale result exists
+        queue_timeout: Seconds a queued caller waits before being shed
+        retry_after: Seconds suggested to shed callers
+        max_entries: Last-good results kept (least recently used dropped)
+        max_age: Seconds a result is reused without recomputing, even
+            below capacity (0 always recomputes)
+    """
+
+    def __init__(self, name, max_concurrent=2, max_queue=8, queue_timeout=10.0,
+                 retry_after=5, max_entries=32, max_age=0.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.max_entries = max_entries
+        self.max_age = max_age
+
+        self._slot_free = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._results = OrderedDict()  # key -> (value, computed_at, version)
+        self._refreshing = set()
+        self._counters = {
+            "fresh": 0,
+            "hits": 0,
+            "stale_served": 0,
+            "shed": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+        }
+
+    def run(self, key, compute, version=None):
+        """
+        Return compute()'s result for key, subject to admission control.
+
+        Args:
+            key: Hashable cache key for this request's parameters
+            compute: Zero-argument callable producing the result
+            version: Identifier of the current input; a cached result
+                from another version is only reused as stale
+
+        Returns:
+            tuple: (value, age, version) where age is None for a fresh
+                result or the reused result's age in seconds, and
+                version is that of the input the value was computed from.
+                A reused result is a cache hit when its version matches
+                and age < max_age; otherwise it is stale.
+
+        Raises:
+            Overloaded: If the request had to be shed
+        """
+        with self._slot_free:
+            if key in self._results:
+                value, computed_at, value_version = self._results[key]
+                age = time.time() - computed_at
+                if value_version == version and age < self.max_age:
+                    self._results.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return value, age, value_version
+            if self._active >= self.max_concurrent:
+                if key in self._results:
+                    value, computed_at, value_version = self._results[key]
+                    self._results.move_to_end(key)
+                    self._counters["stale_served"] += 1
+                    self._start_refresh(key, compute, version)
+                    return value, time.time() - computed_at, value_version
+                self._wait_for_slot()
+            self._active += 1
+
+        try:
+            value = compute()
+        finally:
+            self.release()
+
+        self._store(key, value, version)
+        with self._slot_free:
+            self._counters["fresh"] += 1
+        return value, None, version
+
+    def acquire(self):
+        """
+        Take a computation slot for uncached work such as a streamed
+        response, queueing or shedding like run(). Pair with release().
+
+        Raises:
+            Overloaded: If the request had to be shed
+        """
+        with self._slot_free:
+            if self._active >= self.max_concurrent:
+                self._wait_for_slot()
+            self._active += 1
+
+    def release(self):
+        """Return a slot taken by acquire()."""
+        with self._slot_free:
+            self._active -= 1
+            self._slot_free.notify()
+
+    def stats(self):
+        """Snapshot of queue depth and serve/shed counters."""
+        with self._slot_free:
+            return {
+                "active": self._active,
+                "max_concurrent": self.max_concurrent,
+                "queue_depth": self._waiting,
+                "max_queue": self.max_queue,
+                "cached_results": len(self._results),
+                "refreshing": len(self._refreshing),
+                **self._counters,
+            }
+
+    def _wait_for_slot(self):
+        """Queue for a slot (lock held); shed if the queue is full or times out."""
+        if self._waiting >= self.max_queue:
+            self._counters["shed"] += 1
+            raise Overloaded(self.name, self.retry_after)
+        self._waiting += 1
+        try:
+            admitted = self._slot_free.wait_for(
+                lambda: self._active < self.max_concurrent,
+                timeout=self.queue_timeout,
+            )
+        finally:
+            self._waiting -= 1
+        if not admitted:
+            self._counters["shed"] += 1
+            raise Overloaded(self.name, self.retry_after)
+
+    def _start_refresh(self, key, compute, version):
+        """Launch one background recomputation for key (lock held)."""
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        thread = threading.Thread(
+            target=self._refresh,
+            args=(key, compute, version),
+            name=f"{self.name}-refresh",
+            daemon=True,
+        )
+        thread.start()
+
+    def _refresh(self, key, compute, version):
+        try:
+            with self._slot_free:
+                self._slot_free.wait_for(lambda: self._active < self.max_concurrent)
+                self._active += 1
+            try:
+                value = compute()
+            finally:
+                self.release()
+            self._store(key, value, version)
+            with self._slot_free:
+                self._counters["refreshes"] += 1
+        except Exception as e:
+            print(f"Warning: background refresh of {self.name} failed: {e}")
+            with self._slot_free:
+                self._counters["refresh_errors"] += 1
+        finally:
+            with self._slot_free:
+                self._refreshing.discard(key)
+
+    def _store(self, key, value, version):
+        with self._slot_free:
+            self._results[key] = (value, time.time(), version)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
@@ -0,0 +1,265 @@
+"""
+processing/batch.py
+
+Batch analysis of many scenes with job IDs and progress tracking.
+
+Each (scene, analysis) pair runs as a task in a bounded process pool.
+Jobs live in this server process independently of any HTTP request, so
+clients can disconnect and poll later, or stream results as scenes
+finish. Workers share scene statistics through raster_cache's on-disk
+cache.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from processing import oil, surface
+except ImportError:
+    import oil
+    import surface
+
+DATA_DIR = "data"  # Scenes must live under this directory
+BATCH_MAX_WORKERS = max(1, min(4, os.cpu_count() or 1))
+MAX_JOBS = 100  # Finished jobs kept for polling before the oldest are dropped
+ANALYSES = ("surface", "oil")
+OIL_OPTIONS = ("screen", "detector", "threshold", "clip_percentiles", "crs")
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_executor = None
+
+
+def submit_batch(scenes, analyses=ANALYSES, options=None):
+    """
+    Queue every (scene, analysis) pair and return immediately.
+
+    Args:
+        scenes: List of raster paths under DATA_DIR
+        analyses: Any of "surface" and "oil"
+        options: Keyword arguments for oil detection (see OIL_OPTIONS)
+
+    Returns:
+        str: Job ID
+
+    Raises:
+        ValueError: On empty input, unknown analyses, unknown or invalid
+            options, or scene paths that are missing or outside DATA_DIR
+        BrokenProcessPool: If the worker pool cannot be restarted
+    """
+    if not scenes:
+        raise ValueError("At least one scene is required")
+    analyses = list(dict.fromkeys(analyses))
+    if not analyses:
+        raise ValueError("At least one analysis is required")
+    unknown = [name for name in analyses if name not in ANALYSES]
+    if unknown:
+        raise ValueError(f"Unknown analyses {unknown}, expected any of {ANALYSES}")
+    options = dict(options or {})
+    unknown = [name for name in options if name not in OIL_OPTIONS]
+    if unknown:
+        raise ValueError(f"Unknown options {unknown}, expected any of {OIL_OPTIONS}")
+    if "oil" in analyses:
+        # Reject bad values now rather than as a failed task per scene
+        oil.check_options(
+            options.get("screen", False),
+            options.get("detector"),
+            options.get("clip_percentiles"),
+            options.get("crs"),
+        )
+    resolved = [(scene, _resolve_scene(scene)) for scene in scenes]
+
+    # Submit before publishing the job, so a failed submission never
+    # leaves a job stuck in "running"
+    futures = _submit_tasks(resolved, analyses, options)
+
+    job_id = uuid.uuid4().hex
+    job = {
+        "job_id": job_id,
+        "status": "running",
+        "created_at": time.time(),
+        "finished_at": None,
+        "total": len(futures),
+        "results": [],
+        "changed": threading.Condition(_jobs_lock),
+    }
+    with _jobs_lock:
+        _prune_jobs()
+        _jobs[job_id] = job
+
+    for (scene, analysis), future in futures:
+        future.add_done_callback(
+            lambda f, s=scene, a=analysis: _record_result(job, s, a, f)
+        )
+    return job_id
+
+
+def get_batch_status(job_id, include_results=True):
+    """
+    Progress and (optionally) per-scene results of a job.
+
+    Returns:
+        dict or None: None if the job ID is unknown
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        return _job_summary(job, include_results)
+
+
+def iter_batch_results(job_id, timeout=None):
+    """
+    Yield per-scene results in completion order, blocking until the
+    next one finishes, and stop when the job is done.
+
+    Args:
+        job_id: Job to follow
+        timeout: Seconds to wait for any single result (None waits forever)
+
+    Yields:
+        dict: {"scene", "analysis", "status", "result" or "error"}
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        return
+
+    sent = 0
+    while True:
+        with job["changed"]:
+            if not job["changed"].wait_for(
+                lambda: len(job["results"]) > sent or job["status"] != "running",
+                timeout=timeout,
+            ):
+                return
+            pending = job["results"][sent:]
+            done = job["status"] != "running"
+        yield from pending
+        sent += len(pending)
+        if done and sent >= job["total"]:
+            return
+
+
+def shutdown_batch():
+    """Stop the worker pool; call on application shutdown."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _submit_tasks(resolved, analyses, options):
+    """
+    Submit every (scene, analysis) task to the pool.
+
+    A pool whose worker died (segfault, OOM) is broken for good, so it
+    is replaced and the submission retried once.
+
+    Returns:
+        list: ((scene, analysis), future) pairs
+    """
+    executor = _get_executor()
+    for attempt in range(2):
+        futures = []
+        try:
+            for scene, path in resolved:
+                for analysis in analyses:
+                    future = executor.submit(_run_task, path, analysis, options)
+                    futures.append(((scene, analysis), future))
+            return futures
+        except BrokenProcessPool:
+            for _, future in futures:
+                future.cancel()
+            if attempt:
+                raise
+            print("Warning: batch worker pool is broken, restarting it")
+            executor = _get_executor(discard=executor)
+
+
+def _run_task(path, analysis, options):
+    """Worker entry point: run one analysis on one scene."""
+    if analysis == "surface":
+        return surface.get_surface_health(path=path)
+    return oil.get_oil_slicks(path=path, **options)
+
+
+def _record_result(job, scene, analysis, future):
+    entry = {"scene": scene, "analysis": analysis}
+    if future.cancelled():
+        entry.update(status="cancelled", error="Cancelled on shutdown")
+    elif future.exception() is not None:
+        entry.update(status="error", error=str(future.exception()))
+    elif isinstance(future.result(), dict) and "error" in future.result():
+        entry.update(status="error", error=future.result()["error"])
+    else:
+        entry.update(status="done", result=future.result())
+
+    with job["changed"]:
+        job["results"].append(entry)
+        if len(job["results"]) >= job["total"]:
+            job["status"] = "completed"
+            job["finished_at"] = time.time()
+        job["changed"].notify_all()
+
+
+def _job_summary(job, include_results):
+    completed = len(job["results"])
+    summary = {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "finished_at": job["finished_at"],
+        "total": job["total"],
+        "completed": completed,
+        "failed": sum(1 for r in job["results"] if r["status"] != "done"),
+        "progress": round(completed / job["total"], 4),
+    }
+    if include_results:
+        summary["results"] = list(job["results"])
+    return summary
+
+
+def _resolve_scene(scene):
+    """Resolve a scene path, rejecting missing files and anything outside DATA_DIR."""
+    data_dir = os.path.realpath(DATA_DIR)
+    path = os.path.realpath(scene if os.path.isabs(scene) else os.path.join(".", scene))
+    if os.path.commonpath([data_dir, path]) != data_dir:
+        raise ValueError(f"Scene {scene!r} is outside {DATA_DIR}/")
+    if not os.path.isfile(path):
+        raise ValueError(f"Scene {scene!r} does not exist")
+    return path
+
+
+def _prune_jobs():
+    """Drop the oldest finished jobs beyond MAX_JOBS (lock held)."""
+    finished = [job for job in _jobs.values() if job["status"] != "running"]
+    finished.sort(key=lambda job: job["created_at"])
+    for job in finished[:max(0, len(_jobs) - MAX_JOBS + 1)]:
+        del _jobs[job["job_id"]]
+
+
+def _get_executor(discard=None):
+    """
+    Shared worker pool, created on first use.
+
+    Args:
+        discard: Broken pool to replace, if it is still the current one
+    """
+    global _executor
+    with _jobs_lock:
+        if discard is not None and _executor is discard:
+            discard.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        if _executor is None:
+            # Spawn rather than fork: the server process runs threads
+            _executor = ProcessPoolExecutor(
+                max_workers=BATCH_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
@@ -0,0 +1,331 @@
+"""
+processing/events.py
+
+Push delivery of result changes to dashboards over Server-Sent Events.
+
+Whenever slick detections or surface metrics are republished, the new
+result is diffed against the previous one and only the delta (added,
+changed and removed slicks, or updated metrics) is fanned out to
+subscribers whose bbox it touches. Each subscriber has a bounded buffer;
+a client that falls behind has its backlog dropped and receives a single
+"resync" event telling it to refetch over REST.
+
+A slick keeps its id across detections as long as it overlaps its
+previous outline, so a slick that grows or drifts is reported as
+changed rather than removed and re-added.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import threading
+
+import numpy as np
+
+# Lazy import for optional dependency
+try:
+    import shapely
+    SHAPELY_AVAILABLE = True
+except ImportError:
+    SHAPELY_AVAILABLE = False
+
+TOPICS = ("slicks", "surface")
+CLIENT_BUFFER = 64         # Events queued per subscriber before resync
+HEARTBEAT_SECONDS = 15.0   # Keep-alive comment interval for idle streams
+KEY_DECIMALS = 4           # New slick ids: bbox center rounded to ~10 m
+MATCH_IOU = 0.3            # Overlap (intersection over union) to keep a slick's id
+
+_lock = threading.Lock()
+_subscribers = set()
+_event_ids = itertools.count(1)
+
+# Last published state per topic, used for diffing and initial snapshots
+_slicks = {"keys": [], "signatures": {}, "bboxes": {}, "table": None}
+_surface = {"result": None}
+
+
+class Subscription:
+    """One connected client: its filters and bounded event buffer."""
+
+    def __init__(self, topics, bbox, loop):
+        self.topics = set(topics)
+        self.bbox = bbox
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=CLIENT_BUFFER)
+
+    def offer(self, event):
+        """Enqueue from the event loop; on overflow replace backlog with resync."""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_event("resync", _encode({"reason": "client buffer overflow"})))
+
+
+def subscribe(topics=TOPICS, bbox=None, snapshot=True):
+    """
+    Register a subscriber; must be called from the serving event loop.
+
+    Args:
+        topics: Subset of TOPICS to receive
+        bbox: Optional (minx, miny, maxx, maxy) scope
+        snapshot: Queue the current state as an initial delta
+
+    Returns:
+        Subscription
+
+    Raises:
+        ValueError: On unknown topics
+    """
+    unknown = set(topics) - set(TOPICS)
+    if unknown:
+        raise ValueError(f"Unknown topics {sorted(unknown)}, expected any of {TOPICS}")
+    sub = Subscription(topics, bbox, asyncio.get_running_loop())
+    with _lock:
+        _subscribers.add(sub)
+        if snapshot:
+            if "slicks" in sub.topics and _slicks["table"] is not None:
+                table = _slicks["table"]
+                rows = range(len(table))
+                features = _keyed_features(table, _slicks["keys"], rows)
+                delta = _slick_delta(features, table.bboxes, rows, [], [], bbox)
+                if delta:
+                    sub.offer(_event("slicks", delta))
+            if "surface" in sub.topics and _surface["result"] is not None:
+                if _touches(_surface_bbox(_surface["result"]), bbox):
+                    sub.offer(_event("surface", _encode(_surface["result"])))
+    return sub
+
+
+def unsubscribe(sub):
+    with _lock:
+        _subscribers.discard(sub)
+
+
+def subscriber_count():
+    with _lock:
+        return len(_subscribers)
+
+
+def publish_slicks(table):
+    """
+    Diff a new detection FeatureTable against the last one and push the
+    delta. Safe to call from any thread.
+
+    Features are encoded once per publish, and each delta once per
+    distinct subscriber bbox, so fan-out cost is per scope rather than
+    per subscriber.
+    """
+    signatures = _slick_signatures(table)
+    bboxes = table.bboxes
+
+    with _lock:
+        keys = _slick_keys(table, _slicks["table"], _slicks["keys"])
+        previous = _slicks["signatures"]
+        added = [row for row, key in enumerate(keys) if key not in previous]
+        # Changed slicks keep their previous bbox, so a subscriber whose
+        # scope the slick drifted out of is told it was removed
+        changed = [(row, _slicks["bboxes"][key]) for row, key in enumerate(keys)
+                   if key in previous and previous[key] != signatures[row]]
+        current = set(keys)
+        removed = [(key, _slicks["bboxes"][key]) for key in _slicks["keys"]
+                   if key not in current]
+
+        _slicks.update(
+            keys=keys,
+            signatures=dict(zip(keys, signatures)),
+            bboxes={key: tuple(bbox) for key, bbox in zip(keys, bboxes.tolist())},
+            table=table,
+        )
+        if not (added or changed or removed):
+            return
+        features = _keyed_features(table, keys, added + [row for row, _ in changed])
+        deltas = {}
+        for sub in list(_subscribers):
+            if "slicks" not in sub.topics:
+                continue
+            if sub.bbox not in deltas:
+                deltas[sub.bbox] = _slick_delta(features, bboxes, added, changed, removed, sub.bbox)
+            if deltas[sub.bbox]:
+                _send(sub, _event("slicks", deltas[sub.bbox]))
+
+
+def publish_surface(result):
+    """Push surface metrics if they differ from the last published ones."""
+    if "error" in result:
+        return
+    with _lock:
+        if result == _surface["result"]:
+            return
+        _surface["result"] = result
+        bounds = _surface_bbox(result)
+        data = _encode(result)
+        for sub in list(_subscribers):
+            if "surface" in sub.topics and _touches(bounds, sub.bbox):
+                _send(sub, _event("surface", data))
+
+
+async def iter_sse(sub, is_disconnected):
+    """
+    Yield Server-Sent Event frames for a subscription until the client
+    disconnects, with periodic keep-alive comments.
+
+    Args:
+        sub: Subscription from subscribe()
+        is_disconnected: Async callable reporting client disconnect
+    """
+    try:
+        while not await is_disconnected():
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield event
+    finally:
+        unsubscribe(sub)
+
+
+def _send(sub, event):
+    """Hand an event to a subscriber's loop from any thread."""
+    try:
+        sub.loop.call_soon_threadsafe(sub.offer, event)
+    except RuntimeError:
+        # Loop closed; the stream's finally block will unsubscribe
+        pass
+
+
+def _encode(payload):
+    return json.dumps(payload, separators=(",", ":"))
+
+
+def _event(name, data):
+    """SSE frame for an encoded payload; each frame gets its own id."""
+    return f"id: {next(_event_ids)}\nevent: {name}\ndata: {data}\n\n"
+
+
+def _slick_delta(features, bboxes, added, changed, removed, bbox):
+    """
+    Encoded delta restricted to bbox, or None if nothing is in scope.
+
+    Args:
+        features: dict of row -> (encoded Feature, key) from _keyed_features()
+        bboxes: Current table's bboxes
+        added: Rows of new slicks
+        changed: (row, previous bbox) of slicks whose outline or
+            properties changed; one that moved into or out of bbox is
+            reported as added or removed
+        removed: (key, previous bbox) of slicks that disappeared
+    """
+    added = [row for row in added if _touches(bboxes[row], bbox)]
+    changed_rows = []
+    removed = [key for key, box in removed if _touches(box, bbox)]
+    for row, previous_box in changed:
+        inside, was_inside = _touches(bboxes[row], bbox), _touches(previous_box, bbox)
+        if inside and was_inside:
+            changed_rows.append(row)
+        elif inside:
+            added.append(row)  # Drifted into scope
+        elif was_inside:
+            removed.append(features[row][1])  # Drifted out of scope
+    if not (added or changed_rows or removed):
+        return None
+    return (
+        '{"added":[' + ",".join(features[row][0] for row in added)
+        + '],"changed":[' + ",".join(features[row][0] for row in changed_rows)
+        + '],"removed":' + _encode(removed)
+        + ',"slick_count":' + str(len(bboxes)) + "}"
+    )
+
+
+def _keyed_features(table, keys, rows):
+    """dict of row -> (encoded Feature with its key as "id", key)."""
+    rows = list(rows)
+    ids = [keys[row] for row in rows]
+    encoded = table.take(np.asarray(rows, dtype=np.int64)).iter_json(ids=ids)
+    return {row: (text, key) for row, key, text in zip(rows, ids, encoded)}
+
+
+def _slick_keys(table, previous_table=None, previous_keys=()):
+    """
+    Stable identity per slick.
+
+    Each slick inherits the key of the previous slick it overlaps best
+    (IoU of at least MATCH_IOU, one-to-one); unmatched slicks get a new
+    key from their rounded bbox center.
+    """
+    keys = _match_previous(table, previous_table, previous_keys)
+    taken = set(key for key in keys if key is not None)
+    bboxes = table.bboxes
+    centers = np.round((bboxes[:, :2] + bboxes[:, 2:]) / 2, KEY_DECIMALS)
+    for row, (lon, lat) in enumerate(centers.tolist()):
+        if keys[row] is not None:
+            continue
+        base = key = f"{lon:.{KEY_DECIMALS}f},{lat:.{KEY_DECIMALS}f}"
+        suffix = 1
+        while key in taken:
+            suffix += 1
+            key = f"{base}#{suffix}"
+        taken.add(key)
+        keys[row] = key
+    return keys
+
+
+def _match_previous(table, previous_table, previous_keys):
+    """Previous key for each row of table, or None where nothing overlaps enough."""
+    keys = [None] * len(table)
+    if (not SHAPELY_AVAILABLE or previous_table is None
+            or not len(previous_table) or not len(table)):
+        return keys
+
+    current = table.to_shapely()
+    previous = previous_table.to_shapely()
+    rows, prev_rows = shapely.STRtree(previous).query(current, predicate="intersects")
+    if not len(rows):
+        return keys
+    overlap = shapely.area(shapely.intersection(current[rows], previous[prev_rows]))
+    union = shapely.area(current[rows]) + shapely.area(previous[prev_rows]) - overlap
+    iou = overlap / np.maximum(union, np.finfo(float).tiny)
+
+    # Greedy one-to-one assignment, best overlaps first
+    used = set()
+    for idx in np.argsort(-iou, kind="stable"):
+        if iou[idx] < MATCH_IOU:
+            break
+        row, prev_row = int(rows[idx]), int(prev_rows[idx])
+        if keys[row] is None and prev_row not in used:
+            keys[row] = previous_keys[prev_row]
+            used.add(prev_row)
+    return keys
+
+
+def _slick_signatures(table):
+    """Hash of each slick's vertices and properties, to detect changes."""
+    vertex_offsets = table.ring_offsets[table.polygon_offsets[table.geometry_offsets]]
+    columns = [table.column(name).tolist() for name in table.columns if name != "id"]
+    signatures = []
+    for row in range(len(table)):
+        digest = hashlib.sha1(
+            table.coords[vertex_offsets[row]:vertex_offsets[row + 1]].tobytes()
+        )
+        digest.update(repr([column[row] for column in columns]).encode())
+        signatures.append(digest.hexdigest())
+    return signatures
+
+
+def _surface_bbox(result):
+    bounds = result.get("bounds")
+    if not bounds:
+        return None
+    return (bounds["west"], bounds["south"], bounds["east"], bounds["north"])
+
+
+def _touches(box, bbox):
+    """True if box intersects bbox; unscoped subscribers see everything."""
+    if bbox is None:
+        return True
+    if box is None or np.isnan(box[0]):
+        return False
+    return box[0] <= bbox[2] and box[2] >= bbox[0] and box[1] <= bbox[3] and box[3] >= bbox[1]
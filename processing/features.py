@@ -0,0 +1,378 @@
+"""
+processing/features.py
+
+Compact, array-backed storage for polygon feature collections.
+
+Coordinates live in one contiguous (n, 2) float64 buffer, indexed by
+ring, polygon and geometry offset arrays (the GeoArrow multipolygon
+layout). Properties are typed NumPy columns; string columns are stored
+as integer codes plus a label table. Serializers work from the arrays
+directly, so thousands of slicks or zones never exist as nested lists
+of per-vertex Python objects while cached.
+
+Geometries are planar: Z and M values in input rings are dropped, as
+the API contract, bbox index and tile encoder are all 2D.
+"""
+
+import json
+
+import numpy as np
+
+# Lazy import for optional dependency
+try:
+    import shapely
+    from shapely import GeometryType
+    SHAPELY_AVAILABLE = True
+except ImportError:
+    SHAPELY_AVAILABLE = False
+
+COORD_DECIMALS = 7  # Digits written by iter_json() (~1 cm in degrees)
+
+
+class FeatureTable:
+    """
+    Columnar collection of Polygon / MultiPolygon features.
+
+    Attributes:
+        coords: (n_vertices, 2) float64 coordinate buffer
+        ring_offsets: Start of each ring in coords (n_rings + 1)
+        polygon_offsets: Start of each polygon in ring_offsets (n_polygons + 1)
+        geometry_offsets: Start of each feature in polygon_offsets (n_features + 1)
+        multi: Bool per feature, True if it was a MultiPolygon
+        columns: dict of property name -> 1D array (codes for categoricals)
+        categories: dict of categorical column name -> tuple of labels
+    """
+
+    def __init__(self, coords, ring_offsets, polygon_offsets, geometry_offsets,
+                 multi, columns=None, categories=None):
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.polygon_offsets = polygon_offsets
+        self.geometry_offsets = geometry_offsets
+        self.multi = multi
+        self.columns = columns or {}
+        self.categories = categories or {}
+
+    def __len__(self):
+        return len(self.geometry_offsets) - 1
+
+    @classmethod
+    def empty(cls):
+        return FeatureTableBuilder().build()
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the table's arrays."""
+        arrays = [self.coords, self.ring_offsets, self.polygon_offsets,
+                  self.geometry_offsets, self.multi, *self.columns.values()]
+        return sum(array.nbytes for array in arrays)
+
+    @property
+    def bboxes(self):
+        """(n_features, 4) array of minx, miny, maxx, maxy; NaN if empty."""
+        bboxes = np.full((len(self), 4), np.nan)
+        vertex_offsets = self.ring_offsets[self.polygon_offsets[self.geometry_offsets]]
+        starts, ends = vertex_offsets[:-1], vertex_offsets[1:]
+        filled = ends > starts
+        if filled.any():
+            # Features are contiguous in coords, so each non-empty one is
+            # exactly the segment up to the next non-empty start
+            starts = starts[filled]
+            bboxes[filled, :2] = np.minimum.reduceat(self.coords, starts, axis=0)
+            bboxes[filled, 2:] = np.maximum.reduceat(self.coords, starts, axis=0)
+        return bboxes
+
+    def column(self, name):
+        """Property column decoded to its external values."""
+        values = self.columns[name]
+        if name in self.categories:
+            return np.asarray(self.categories[name], dtype=object)[values]
+        return values
+
+    def take(self, indices):
+        """
+        New table holding only the given features, in the given order.
+
+        Args:
+            indices: Integer index array, boolean mask or slice
+        """
+        rows = np.arange(len(self))[indices]
+        builder = FeatureTableBuilder()
+        for row in rows:
+            builder.append_arrays(list(self._polygon_rings(row)), self.multi[row])
+        columns = {name: values[rows] for name, values in self.columns.items()}
+        table = builder.build()
+        table.columns = columns
+        table.categories = dict(self.categories)
+        return table
+
+    def geometry(self, row):
+        """GeoJSON geometry dict for one feature."""
+        polygons = [
+            [ring.tolist() for ring in rings]
+            for rings in self._polygon_rings(row)
+        ]
+        if self.multi[row]:
+            return {"type": "MultiPolygon", "coordinates": polygons}
+        return {"type": "Polygon", "coordinates": polygons[0] if polygons else []}
+
+    def iter_features(self):
+        """
+        Yield GeoJSON Feature dicts, converting each column to Python
+        values once rather than per feature. Prefer iter_json() when the
+        features are only going to be serialized.
+        """
+        names = list(self.columns)
+        values = [self.column(name).tolist() for name in names]
+        for row in range(len(self)):
+            yield {
+                "type": "Feature",
+                "properties": {name: column[row] for name, column in zip(names, values)},
+                "geometry": self.geometry(row),
+            }
+
+    def iter_json(self, ids=None):
+        """
+        Yield each feature as GeoJSON text.
+
+        All coordinates are formatted to text (rounded to COORD_DECIMALS)
+        in one vectorized pass over the buffer, and each ring is then a
+        slice of that text, so no per-vertex Python objects are created.
+
+        Args:
+            ids: Optional sequence of Feature "id" members, one per row
+        """
+        text, vertex_offsets = _vertex_text(self.coords)
+        ring_starts = vertex_offsets[self.ring_offsets].tolist()
+        polygon_offsets = self.polygon_offsets.tolist()
+        geometry_offsets = self.geometry_offsets.tolist()
+        names = list(self.columns)
+        values = [self.column(name).tolist() for name in names]
+
+        for row in range(len(self)):
+            properties = json.dumps(
+                {name: column[row] for name, column in zip(names, values)},
+                separators=(",", ":"),
+            )
+            polygons = []
+            for polygon in range(geometry_offsets[row], geometry_offsets[row + 1]):
+                rings = [
+                    # Drop the separator after the ring's last vertex
+                    "[" + text[ring_starts[ring]:max(ring_starts[ring], ring_starts[ring + 1] - 1)] + "]"
+                    for ring in range(polygon_offsets[polygon], polygon_offsets[polygon + 1])
+                ]
+                polygons.append("[" + ",".join(rings) + "]")
+            if self.multi[row]:
+                geom_type, coordinates = "MultiPolygon", "[" + ",".join(polygons) + "]"
+            else:
+                geom_type, coordinates = "Polygon", polygons[0] if polygons else "[]"
+            member = "" if ids is None else ',"id":' + json.dumps(ids[row])
+            yield ('{"type":"Feature"' + member + ',"properties":' + properties
+                   + ',"geometry":{"type":"' + geom_type
+                   + '","coordinates":' + coordinates + "}}")
+
+    def to_shapely(self):
+        """
+        Vectorized conversion to an array of shapely geometries.
+
+        Empty features come out as POLYGON EMPTY / MULTIPOLYGON EMPTY.
+        """
+        if not SHAPELY_AVAILABLE:
+            raise ImportError("shapely is required for FeatureTable.to_shapely()")
+        geometries = shapely.from_ragged_array(
+            GeometryType.MULTIPOLYGON,
+            self.coords,
+            (self.ring_offsets, self.polygon_offsets, self.geometry_offsets),
+        )
+        single = ~self.multi
+        geometries[single] = shapely.get_geometry(geometries[single], 0)
+        # get_geometry() returns None for a Polygon feature with no polygon
+        empty = single & (np.diff(self.geometry_offsets) == 0)
+        geometries[empty] = shapely.from_wkt("POLYGON EMPTY")
+        return geometries
+
+    def to_wkb(self):
+        """Array of WKB bytes per feature, e.g. for database inserts."""
+        return shapely.to_wkb(self.to_shapely())
+
+    def _polygon_rings(self, row):
+        for polygon in range(self.geometry_offsets[row], self.geometry_offsets[row + 1]):
+            first, last = self.polygon_offsets[polygon], self.polygon_offsets[polygon + 1]
+            yield [
+                self.coords[self.ring_offsets[ring]:self.ring_offsets[ring + 1]]
+                for ring in range(first, last)
+            ]
+
+
+class FeatureTableBuilder:
+    """
+    Incrementally assemble a FeatureTable.
+
+    Rings are converted to NumPy arrays as they are appended, so the
+    nested coordinate lists of each input geometry can be released
+    immediately.
+    """
+
+    def __init__(self):
+        self._rings = []
+        self._polygon_ring_counts = []
+        self._geometry_polygon_counts = []
+        self._multi = []
+        self._columns = {}
+
+    def __len__(self):
+        return len(self._multi)
+
+    def append(self, geometry, **properties):
+        """
+        Add one feature.
+
+        Args:
+            geometry: GeoJSON Polygon or MultiPolygon dict
+            **properties: Property values for this feature
+        """
+        geom_type = geometry["type"] if geometry else "MultiPolygon"
+        if geom_type == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geom_type == "MultiPolygon":
+            polygons = geometry["coordinates"] if geometry else []
+        else:
+            raise ValueError(f"Unsupported geometry type {geom_type!r}")
+
+        rings = [[_ring_array(ring) for ring in polygon] for polygon in polygons]
+        self.append_arrays(rings, geom_type == "MultiPolygon", **properties)
+
+    def append_arrays(self, polygons, multi, **properties):
+        """
+        Add one feature from per-polygon lists of (n, 2) ring arrays.
+
+        Polygons without rings are dropped: shapely cannot decode them
+        from the ragged layout, and an empty feature is fully described
+        by having no polygons.
+        """
+        polygons = [rings for rings in polygons if rings]
+        for rings in polygons:
+            self._rings.extend(rings)
+            self._polygon_ring_counts.append(len(rings))
+        self._geometry_polygon_counts.append(len(polygons))
+        self._multi.append(multi)
+        for name, value in properties.items():
+            self._columns.setdefault(name, []).append(value)
+
+    def build(self, dtypes=None, categorical=()):
+        """
+        Finish the table.
+
+        Args:
+            dtypes: Optional dict of column name -> NumPy dtype
+            categorical: Column names to store as integer codes
+
+        Returns:
+            FeatureTable
+        """
+        dtypes = dtypes or {}
+        ring_lengths = [len(ring) for ring in self._rings]
+        coords = (np.concatenate(self._rings) if self._rings
+                  else np.empty((0, 2), dtype=np.float64))
+
+        columns, categories = {}, {}
+        for name, values in self._columns.items():
+            if name in categorical:
+                labels, codes = np.unique(np.asarray(values, dtype=object).astype(str),
+                                          return_inverse=True)
+                columns[name] = codes.astype(np.uint8 if len(labels) <= 256 else np.int32)
+                categories[name] = tuple(labels.tolist())
+            else:
+                columns[name] = np.asarray(values, dtype=dtypes.get(name))
+
+        return FeatureTable(
+            coords=coords,
+            ring_offsets=_offsets(ring_lengths),
+            polygon_offsets=_offsets(self._polygon_ring_counts),
+            geometry_offsets=_offsets(self._geometry_polygon_counts),
+            multi=np.asarray(self._multi, dtype=bool),
+            columns=columns,
+            categories=categories,
+        )
+
+
+def _vertex_text(coords):
+    """
+    Format a coordinate buffer as one string of "[x,y]," items.
+
+    Digits are computed arithmetically into one byte matrix per axis
+    and the unused positions masked out, so the text is produced without
+    a Python object per number.
+
+    Returns:
+        tuple: (text, offsets) where vertex i is text[offsets[i]:offsets[i + 1]]
+    """
+    count = len(coords)
+    if not count:
+        return "", np.zeros(1, dtype=np.int64)
+    x_chars, x_mask = _number_chars(coords[:, 0])
+    y_chars, y_mask = _number_chars(coords[:, 1])
+    x_end = 1 + x_chars.shape[1]
+    y_end = x_end + 1 + y_chars.shape[1]
+
+    chars = np.empty((count, y_end + 2), dtype=np.uint8)
+    mask = np.ones(chars.shape, dtype=bool)
+    chars[:, 0] = ord("[")
+    chars[:, 1:x_end], mask[:, 1:x_end] = x_chars, x_mask
+    chars[:, x_end] = ord(",")
+    chars[:, x_end + 1:y_end], mask[:, x_end + 1:y_end] = y_chars, y_mask
+    chars[:, y_end] = ord("]")
+    chars[:, y_end + 1] = ord(",")
+
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(mask.sum(axis=1), out=offsets[1:])
+    return chars[mask].tobytes().decode("ascii"), offsets
+
+
+def _number_chars(values):
+    """
+    ASCII matrix and validity mask of values rounded to COORD_DECIMALS.
+    Layout per row: sign, integer digits, point, fraction digits; leading
+    and trailing zeros are masked out.
+    """
+    scaled = np.round(values * 10 ** COORD_DECIMALS).astype(np.int64)
+    whole, frac = np.divmod(np.abs(scaled), 10 ** COORD_DECIMALS)
+    int_width = len(str(int(whole.max())))
+    int_digits = _digits(whole, int_width)
+    frac_digits = _digits(frac, COORD_DECIMALS)
+
+    int_mask = np.maximum.accumulate(int_digits > 0, axis=1)
+    int_mask[:, -1] = True
+    frac_mask = np.maximum.accumulate((frac_digits > 0)[:, ::-1], axis=1)[:, ::-1]
+
+    chars = np.empty((len(values), int_width + COORD_DECIMALS + 2), dtype=np.uint8)
+    mask = np.empty(chars.shape, dtype=bool)
+    chars[:, 0], mask[:, 0] = ord("-"), scaled < 0
+    chars[:, 1:int_width + 1], mask[:, 1:int_width + 1] = int_digits + ord("0"), int_mask
+    chars[:, int_width + 1], mask[:, int_width + 1] = ord("."), frac_mask[:, 0]
+    chars[:, int_width + 2:], mask[:, int_width + 2:] = frac_digits + ord("0"), frac_mask
+    return chars, mask
+
+
+def _digits(values, width):
+    """(n, width) decimal digits of non-negative integers, most significant first."""
+    rest = values.astype(np.uint32 if values.max() < 2 ** 32 else np.uint64)
+    digits = np.empty((len(values), width), dtype=np.uint8)
+    for col in range(width - 1, -1, -1):
+        rest, digits[:, col] = np.divmod(rest, 10)
+    return digits
+
+
+def _ring_array(ring):
+    """(n, 2) float64 array of a GeoJSON ring; Z/M values are dropped."""
+    coords = np.asarray(ring, dtype=np.float64)
+    if coords.size == 0:
+        return np.empty((0, 2), dtype=np.float64)
+    return coords[:, :2]
+
+
+def _offsets(counts):
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
@@ -0,0 +1,250 @@
+"""
+processing/geojson.py
+
+Pagination and streaming serialization for GeoJSON feature iterators.
+Lets the API page through, or stream, large feature collections
+without materializing them as one Python list.
+"""
+
+import base64
+import json
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+GEOJSON_MEDIA_TYPE = "application/geo+json"
+READ_CHUNK_BYTES = 1 << 20  # Initial read size for incremental parsing
+
+_decoder = json.JSONDecoder()
+
+
+def encode_cursor(offset, version=None):
+    """
+    Opaque pagination cursor for the feature at position `offset`.
+
+    Args:
+        offset: Number of features already returned
+        version: Optional identifier of the result being paged
+
+    Returns:
+        str: URL-safe cursor string
+    """
+    payload = {"offset": offset}
+    if version is not None:
+        payload["version"] = version
+    raw = json.dumps(payload).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Inverse of encode_cursor().
+
+    Returns:
+        tuple: (offset, version)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        offset = payload["offset"]
+    except Exception:
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    return offset, payload.get("version")
+
+
+def page_slice(total, limit=None, cursor=None, version=None):
+    """
+    Resolve paging arguments against a collection of known size.
+
+    Args:
+        total: Number of features available
+        limit: Maximum features per page (None returns everything)
+        cursor: Cursor from a previous page's "next_cursor"
+        version: Identifier of the collection; a cursor issued for a
+            different version is rejected rather than skipping or
+            repeating features
+
+    Returns:
+        tuple: (slice, next_cursor) where next_cursor is None on the
+            last page
+
+    Raises:
+        ValueError: If limit or cursor is invalid, or the cursor is
+            from another version
+    """
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be a positive integer")
+    start = 0
+    if cursor:
+        start, cursor_version = decode_cursor(cursor)
+        if cursor_version != version:
+            raise ValueError("Cursor is from an earlier result; restart from the first page")
+    end = start + limit if limit is not None else total
+
+    next_cursor = encode_cursor(end, version) if end < total else None
+    return slice(start, end), next_cursor
+
+
+def iter_ndjson(features):
+    """
+    Serialize features as newline-delimited GeoJSON, one line each.
+
+    Args:
+        features: Feature dicts, or already encoded JSON strings
+            (e.g. from FeatureTable.iter_json())
+
+    Yields:
+        str: One JSON-encoded Feature followed by a newline
+    """
+    for feature in features:
+        yield _encode_feature(feature) + "\n"
+
+
+def iter_feature_collection(features, **members):
+    """
+    Serialize a FeatureCollection incrementally.
+
+    Foreign members (e.g. "aoi") are written before the features array,
+    then features are emitted one at a time as they are produced.
+
+    Args:
+        features: Feature dicts or already encoded JSON strings
+        **members: Extra top-level members
+
+    Yields:
+        str: Chunks of a single GeoJSON FeatureCollection document
+    """
+    return iter_object_with_features({"type": "FeatureCollection", **members}, features)
+
+
+def iter_object_with_features(members, features):
+    """
+    Serialize a JSON object whose last member is a "features" array,
+    e.g. a paged API response.
+
+    Yields:
+        str: Chunks of a single JSON document
+    """
+    header = json.dumps(members, separators=(",", ":"))[:-1]
+    yield header + (',"features":[' if members else '"features":[')
+    separator = ""
+    for feature in features:
+        yield separator + _encode_feature(feature)
+        separator = ","
+    yield "]}"
+
+
+def _encode_feature(feature):
+    if isinstance(feature, str):
+        return feature
+    return json.dumps(feature, separators=(",", ":"))
+
+
+def iter_geojson_features(path):
+    """
+    Parse a GeoJSON FeatureCollection incrementally.
+
+    Top-level members are walked in order and only the "features" array
+    is decoded, one Feature at a time, so memory stays proportional to
+    the largest single feature rather than the whole file.
+
+    Args:
+        path: Path to a GeoJSON file
+
+    Yields:
+        dict: Raw Feature objects as they appear in the file
+
+    Raises:
+        ValueError: If the file is not a FeatureCollection object
+    """
+    with open(path, "r") as f:
+        reader = _JSONReader(f)
+        reader.expect("{")
+        while not reader.consume("}"):
+            key = reader.decode()
+            reader.expect(":")
+            if key != "features":
+                reader.decode()  # Skip other members
+            else:
+                reader.expect("[")
+                while not reader.consume("]"):
+                    yield reader.decode()
+                    reader.consume(",")
+            reader.consume(",")
+
+
+class _JSONReader:
+    """Buffered reader that decodes one JSON value at a time from a file."""
+
+    def __init__(self, f):
+        self._file = f
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size=READ_CHUNK_BYTES):
+        chunk = self._file.read(size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def consume(self, char):
+        """Skip whitespace and `char` if it is next; report whether it was."""
+        if self._peek() == char:
+            self._pos += 1
+            return True
+        return False
+
+    def expect(self, char):
+        if not self.consume(char):
+            raise ValueError(f"Expected {char!r} at offset {self._pos}")
+
+    def decode(self):
+        """Decode the next complete JSON value, reading more as needed."""
+        self._peek()
+        size = READ_CHUNK_BYTES
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # Value may be cut off at the buffer end; grow and retry
+                if self._eof or not self._fill(size):
+                    raise
+                size *= 2
+                continue
+            # A number at the buffer end may be truncated
+            if end == len(self._buffer) and not self._eof and self._fill(size):
+                continue
+            self._pos = end
+            return value
+
+
+def parse_bbox(text):
+    """
+    Parse a "minx,miny,maxx,maxy" query string.
+
+    Raises:
+        ValueError: If the string is malformed or the box is inverted
+    """
+    try:
+        minx, miny, maxx, maxy = (float(v) for v in text.split(","))
+    except ValueError:
+        raise ValueError(f"Invalid bbox {text!r}, expected minx,miny,maxx,maxy")
+    if minx > maxx or miny > maxy:
+        raise ValueError(f"Invalid bbox {text!r}, min exceeds max")
+    return (minx, miny, maxx, maxy)
@@ -5,17 +5,48 @@ Detects oil slicks and chemical films from SAR imagery.
 Uses dark patch detection with confidence scoring.
 """
 
+import itertools
 import json
+import math
 
 # Lazy imports for optional dependencies
 try:
     import rasterio
     from rasterio.features import shapes
+    from rasterio.windows import Window
     import numpy as np
     RASTERIO_AVAILABLE = True
 except ImportError:
     RASTERIO_AVAILABLE = False
 
+try:
+    from processing.raster_cache import (
+        MERCATOR_CRS,
+        check_percentiles,
+        get_histogram,
+        get_min_overview,
+        get_mercator_raster,
+        iter_row_chunks,
+        percentile_bounds,
+    )
+except ImportError:
+    from raster_cache import (
+        MERCATOR_CRS,
+        check_percentiles,
+        get_histogram,
+        get_min_overview,
+        get_mercator_raster,
+        iter_row_chunks,
+        percentile_bounds,
+    )
+
+try:
+    from processing.features import FeatureTableBuilder
+    from processing.geojson import iter_object_with_features, page_slice
+except ImportError:
+    from features import FeatureTableBuilder
+    from geojson import iter_object_with_features, page_slice
+
 try:
     from shapely.geometry import shape, mapping
     SHAPELY_AVAILABLE = True
@@ -25,13 +56,35 @@ except ImportError:
 SAR_PATH = "data/sar_harbour.tif"
 DARK_THRESHOLD = 0.3  # Values below this are potential oil slicks
 MIN_AREA_PIXELS = 50  # Minimum slick size to report
+CLIP_PERCENTILES = (0.0, 100.0)  # Normalization bounds, e.g. (2.0, 98.0) for robust clipping
+
+# Coarse-to-fine screening
+OVERVIEW_FACTOR = 8     # Decimation factor for the screening pass
+SCREEN_HALO = 1         # Overview pixels of padding around each candidate
+MAX_REFINE_PASSES = 8   # Window growth iterations before giving up
+
+# Dark-spot detectors
+DETECTOR = "global"  # "global" (scene-normalized) or "local" (local contrast)
+LOCAL_WINDOW = 101   # Background window size in pixels (odd)
+LOCAL_K = 1.5        # Dark if below local mean - LOCAL_K * local std
+DETECT_BLOCK = 1024  # Block size for block-wise local detection
+DETECTORS = ("global", "local")
+OUTPUT_CRS = ("EPSG:4326", MERCATOR_CRS)  # Source CRS or cached Web Mercator copy
+EARTH_RADIUS_M = 6378137.0
 
 
-def get_oil_slicks():
+def get_oil_slicks(screen=False, detector=None, threshold=None, clip_percentiles=None,
+                   limit=None, cursor=None, path=None, crs=None):
     """
     Load SAR raster, detect dark patches (oil slicks),
     and return GeoJSON features for the API contract.
-    
+
+    Args:
+        screen, detector, threshold, clip_percentiles, path, crs:
+            See iter_oil_slicks()
+        limit: Maximum features to return (None returns every slick)
+        cursor: "next_cursor" from a previous page
+
     Returns:
         dict: {
             "aoi": str,
@@ -43,63 +96,460 @@ def get_oil_slicks():
                     "geometry": {"type": "Polygon", "coordinates": [...]}
                 },
                 ...
-            ]
+            ],
+            "next_cursor": str or None
         }
     """
+    table = detect_oil_slicks(screen, detector, threshold, clip_percentiles, path, crs)
+    return slicks_page(table, limit=limit, cursor=cursor, crs=crs)
+
+
+def slicks_page(table, limit=None, cursor=None, crs=None, version=None):
+    """
+    Format one page of a detection FeatureTable for the API contract.
+    
+    Args:
+        table: FeatureTable from detect_oil_slicks()
+        limit: Maximum features to return (None returns every slick)
+        cursor: "next_cursor" from a previous page
+        crs: Coordinate system of the table, reported if not EPSG:4326
+        version: Identifier of the scene the table was detected on;
+            cursors from other versions are rejected
+    """
+    page, members = _slicks_page(table, limit, cursor, crs, version)
+    return {**members, "features": list(page.iter_features())}
+
+
+def slicks_page_json(table, limit=None, cursor=None, crs=None, version=None):
+    """
+    Same as slicks_page(), encoded straight from the table's arrays.
+
+    Returns:
+        str: JSON document
+    """
+    page, members = _slicks_page(table, limit, cursor, crs, version)
+    return "".join(iter_object_with_features(members, page.iter_json()))
+
+
+def _slicks_page(table, limit, cursor, crs, version):
+    """Rows of the requested page and the response's other members."""
+    rows, next_cursor = page_slice(len(table), limit=limit, cursor=cursor,
+                                   version=version)
+    members = {
+        "aoi": "Toronto Harbour",
+        "slick_count": len(table),
+        "next_cursor": next_cursor,
+    }
+    if crs and crs != OUTPUT_CRS[0]:
+        members["crs"] = crs
+    return table.take(rows), members
+
+
+def detect_oil_slicks(screen=False, detector=None, threshold=None, clip_percentiles=None,
+                      path=None, crs=None):
+    """
+    Run detection and collect every slick into a compact FeatureTable.
+
+    Args:
+        See iter_oil_slicks()
+
+    Returns:
+        FeatureTable: Columns "id", "area_km2" and "confidence"
+    """
+    builder = FeatureTableBuilder()
+    for feature in iter_oil_slicks(screen, detector, threshold, clip_percentiles, path, crs):
+        builder.append(feature["geometry"], **feature["properties"])
+    return builder.build(dtypes={"id": "int32", "area_km2": "float64",
+                                 "confidence": "float64"})
+
+
+def iter_oil_slicks(screen=False, detector=None, threshold=None, clip_percentiles=None,
+                    path=None, crs=None):
+    """
+    Detect oil slicks and yield GeoJSON features one at a time.
+
+    Arguments are validated and the raster is opened up front, so errors
+    surface before the first feature is requested.
+
+    Args:
+        screen: If True, find candidate regions on a decimated overview
+            and only read full-resolution windows around them. Only
+            supported by the global detector.
+        detector: "global" thresholds the normalized scene at
+            DARK_THRESHOLD; "local" compares each pixel against its
+            windowed background mean and std. Defaults to DETECTOR.
+        threshold: Normalized darkness threshold (defaults to DARK_THRESHOLD)
+        clip_percentiles: (low, high) percentiles used as normalization
+            bounds (defaults to CLIP_PERCENTILES)
+        path: SAR GeoTIFF to analyse (defaults to SAR_PATH)
+        crs: "EPSG:4326" (default) detects on the source raster;
+            "EPSG:3857" detects on its cached Web Mercator copy, so
+            polygons come out in metres for map overlays
+
+    Returns:
+        iterator: GeoJSON Feature dicts
+    """
     # Check if dependencies are available
     if not RASTERIO_AVAILABLE or not SHAPELY_AVAILABLE:
         print("Warning: rasterio or shapely not installed. Using demo data.")
-        return _generate_demo_slicks()
+        return iter(_generate_demo_slicks()["features"])
+    
+    detector, low, high = check_options(screen, detector, clip_percentiles, crs)
+    if threshold is None:
+        threshold = DARK_THRESHOLD
     
+    path = path or SAR_PATH
+    if crs == MERCATOR_CRS:
+        # Outside the demo fallback below: demo polygons are in degrees
+        # and must never be labelled EPSG:3857
+        path = get_mercator_raster(path)
     try:
-        with rasterio.open(SAR_PATH) as src:
-            sar = src.read(1)
-            transform = src.transform
-            crs = src.crs
-            
-            # Normalize SAR data to 0-1 range
-            sar_normalized = (sar - sar.min()) / (sar.max() - sar.min() + 1e-8)
-            
+        src = rasterio.open(path)
     except FileNotFoundError:
-        print(f"Error: {SAR_PATH} not found. Generating demo data...")
-        return _generate_demo_slicks()
+        print(f"Error: {path} not found. Generating demo data...")
+        return iter(_generate_demo_slicks()["features"])
+    
+    return _iter_detections(src, screen, detector, threshold, low, high)
+
+
+def check_options(screen=False, detector=None, clip_percentiles=None, crs=None):
+    """
+    Validate detection parameters without opening the raster, e.g.
+    before queueing batch work.
+    
+    Returns:
+        tuple: (detector, low, high) with defaults applied
+    
+    Raises:
+        ValueError: On an unknown detector or crs, screening with a
+            non-global detector, or a bad percentile range
+    """
+    detector = detector or DETECTOR
+    if detector not in DETECTORS:
+        raise ValueError(f"Unknown detector {detector!r}, expected one of {DETECTORS}")
+    if screen and detector != "global":
+        # A decimated overview cannot bound a local-contrast test, so
+        # screening would either miss slicks or flag the whole scene
+        raise ValueError(f"screen is only supported with the global detector, not {detector!r}")
     
-    # Detect dark patches (potential oil slicks)
-    dark_mask = sar_normalized < DARK_THRESHOLD
+    if crs not in (None,) + OUTPUT_CRS:
+        raise ValueError(f"Unsupported crs {crs!r}, expected one of {OUTPUT_CRS}")
     
-    # Extract polygon features from mask
-    features = []
-    feature_id = 1
+    try:
+        low, high = (float(q) for q in clip_percentiles or CLIP_PERCENTILES)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid clip_percentiles {clip_percentiles!r}, expected [low, high]")
+    check_percentiles(low, high)
+    return detector, low, high
+
+
+def _iter_detections(src, screen, detector, threshold, low, high):
+    """
+    Run the selected detection path, closing the dataset when done.
+    """
+    with src:
+        # Normalization bounds come from the cached scene histogram, so
+        # thresholds are applied in absolute backscatter units
+        levels = None
+        if detector == "global":
+            sar_low, sar_high = percentile_bounds(get_histogram(src), low, high)
+            levels = (sar_low, sar_high - sar_low + 1e-8, threshold)
+        
+        if screen:
+            yield from _detect_screened(src, levels)
+        else:
+            yield from _detect_full(src, detector, levels)
+
+
+def _detect_full(src, detector, levels):
+    """
+    Threshold and polygonize every full-resolution pixel of the scene,
+    yielding slick features.
+    
+    Args:
+        src: Open rasterio dataset
+        detector: "global" or "local"
+        levels: (low, scale, threshold) normalization for the global detector
+    """
+    if detector == "local":
+        yield from _extract_features(_local_dark_mask(src), src.transform, crs=src.crs)
+        return
+    
+    # Detect dark patches chunk by chunk; only the boolean mask is kept
+    sar_low, scale, threshold = levels
+    cutoff = sar_low + threshold * scale
+    dark_mask = np.empty((src.height, src.width), dtype=bool)
+    for chunk in iter_row_chunks(src):
+        rows = slice(chunk.row_off, chunk.row_off + chunk.height)
+        dark_mask[rows] = src.read(1, window=chunk) < cutoff
+    
+    yield from _extract_features(dark_mask, src.transform, crs=src.crs)
+
+
+def _detect_screened(src, levels):
+    """
+    Coarse-to-fine detection.
+
+    Runs the dark-patch test on a decimated overview, then reads
+    full-resolution windows only around candidate regions. Windows
+    grow until no dark pixel touches an interior edge, so slicks are
+    never clipped by a window boundary.
+
+    The overview holds the minimum of each OVERVIEW_FACTOR block, so
+    every full-resolution pixel below the cutoff marks its block as a
+    candidate and recall matches the full scan exactly, however thin
+    the slick. It does not depend on the threshold and is cached per
+    scene, so only the first screened run reads the full scene; later
+    runs read just the candidate windows.
+    """
+    sar_low, scale, threshold = levels
+    cutoff = sar_low + threshold * scale
+    
+    candidates = get_min_overview(src, OVERVIEW_FACTOR) < cutoff
+    row_step = col_step = OVERVIEW_FACTOR
+    if not candidates.any():
+        return
+    
+    # Map candidate regions back to full-resolution windows
+    windows = []
+    for geom, value in shapes(candidates.astype(np.uint8), mask=candidates):
+        xs, ys = zip(*geom["coordinates"][0])
+        windows.append(_clip_window(
+            src,
+            int((min(ys) - SCREEN_HALO) * row_step),
+            int((min(xs) - SCREEN_HALO) * col_step),
+            int(np.ceil((max(ys) + SCREEN_HALO) * row_step)),
+            int(np.ceil((max(xs) + SCREEN_HALO) * col_step)),
+        ))
+    
+    # Grow windows until every dark region is fully contained
+    pad = int(np.ceil(SCREEN_HALO * max(row_step, col_step)))
+    masks = {}
+    for _ in range(MAX_REFINE_PASSES):
+        windows = _merge_windows(windows)
+        grown = []
+        stable = True
+        for win in windows:
+            key = (win.row_off, win.col_off, win.height, win.width)
+            if key not in masks:
+                masks[key] = src.read(1, window=win) < cutoff
+            row0, col0, row1, col1 = _window_extent(win)
+            mask = masks[key]
+            grow_top = row0 > 0 and mask[0].any()
+            grow_bottom = row1 < src.height and mask[-1].any()
+            grow_left = col0 > 0 and mask[:, 0].any()
+            grow_right = col1 < src.width and mask[:, -1].any()
+            if grow_top or grow_bottom or grow_left or grow_right:
+                stable = False
+                win = _clip_window(
+                    src,
+                    row0 - pad * grow_top,
+                    col0 - pad * grow_left,
+                    row1 + pad * grow_bottom,
+                    col1 + pad * grow_right,
+                )
+            grown.append(win)
+        windows = grown
+        if stable:
+            break
+    
+    ids = itertools.count(1)
+    for win in windows:
+        key = (win.row_off, win.col_off, win.height, win.width)
+        mask = masks.pop(key, None)
+        if mask is None:
+            mask = src.read(1, window=win) < cutoff
+        yield from _extract_features(mask, src.window_transform(win), ids, crs=src.crs)
+
+
+def _local_dark_mask(src, win=None):
+    """
+    Adaptive local-contrast detector.
+    
+    Flags pixels darker than LOCAL_K standard deviations below the mean
+    of their LOCAL_WINDOW x LOCAL_WINDOW neighbourhood. The raster is
+    processed in DETECT_BLOCK tiles, each read with a halo of half a
+    window so results are identical to a whole-scene pass.
+    
+    Args:
+        src: Open rasterio dataset
+        win: Window to detect in (defaults to the whole raster)
+    
+    Returns:
+        np.ndarray: Boolean mask with the shape of the window
+    """
+    if win is None:
+        win = Window(0, 0, src.width, src.height)
+    row0, col0, row1, col1 = _window_extent(win)
+    half = LOCAL_WINDOW // 2
+    dark_mask = np.zeros((row1 - row0, col1 - col0), dtype=bool)
+    
+    for r in range(row0, row1, DETECT_BLOCK):
+        for c in range(col0, col1, DETECT_BLOCK):
+            r_end = min(r + DETECT_BLOCK, row1)
+            c_end = min(c + DETECT_BLOCK, col1)
+            halo = _clip_window(src, r - half, c - half, r_end + half, c_end + half)
+            block = src.read(1, window=halo)
+            mean, std = _box_stats(block, LOCAL_WINDOW)
+            
+            # Crop the halo back off
+            top, left = r - halo.row_off, c - halo.col_off
+            inner = (slice(top, top + r_end - r), slice(left, left + c_end - c))
+            dark_mask[r - row0:r_end - row0, c - col0:c_end - col0] = (
+                block[inner] < mean[inner] - LOCAL_K * std[inner]
+            )
+    
+    return dark_mask
+
+
+def _box_stats(arr, window):
+    """
+    Windowed mean and standard deviation from integral images.
+    
+    Cost per pixel is four lookups per table regardless of window size.
+    Windows are clipped at the array edge and normalized by the number
+    of valid pixels they actually cover.
+    
+    Args:
+        arr: 2D array
+        window: Odd window size in pixels
+    
+    Returns:
+        tuple: (mean, std) arrays with the shape of arr
+    """
+    half = window // 2
+    height, width = arr.shape
+    
+    # NaN (nodata, e.g. outside a warped footprint) is left out of the
+    # statistics; values are centered to limit cancellation
+    valid = ~np.isnan(arr)
+    offset = float(arr[valid].mean()) if valid.any() else 0.0
+    values = np.where(valid, arr - offset, 0.0)
+    sums = np.zeros((height + 1, width + 1))
+    sums[1:, 1:] = values.cumsum(axis=0).cumsum(axis=1)
+    sq_sums = np.zeros((height + 1, width + 1))
+    sq_sums[1:, 1:] = (values * values).cumsum(axis=0).cumsum(axis=1)
+    counts = np.zeros((height + 1, width + 1))
+    counts[1:, 1:] = valid.cumsum(axis=0).cumsum(axis=1)
+    
+    rows = np.arange(height)
+    cols = np.arange(width)
+    r0 = np.clip(rows - half, 0, height)[:, None]
+    r1 = np.clip(rows + half + 1, 0, height)[:, None]
+    c0 = np.clip(cols - half, 0, width)[None, :]
+    c1 = np.clip(cols + half + 1, 0, width)[None, :]
+    
+    def box(table):
+        return table[r1, c1] - table[r0, c1] - table[r1, c0] + table[r0, c0]
+    
+    count = np.maximum(box(counts), 1)
+    mean = box(sums) / count
+    var = np.maximum(box(sq_sums) / count - mean * mean, 0.0)
+    return mean + offset, np.sqrt(var)
+
+
+def _extract_features(dark_mask, transform, ids=None, crs=None):
+    """
+    Polygonize a dark-patch mask into GeoJSON slick features.
+    
+    Args:
+        dark_mask: Boolean array, True where pixels are dark
+        transform: Affine transform of the mask's top-left corner
+        ids: Iterator of feature ids, shared across windows
+            (defaults to counting from 1)
+        crs: CRS of the mask; projected CRSs get areas in true metres
+    
+    Yields:
+        dict: GeoJSON Feature
+    """
+    if ids is None:
+        ids = itertools.count(1)
     
     for geom, value in shapes(dark_mask.astype(np.uint8), transform=transform):
         if value == 1:  # Dark patch
             poly = shape(geom)
-            area_pixels = poly.area / (transform.a * abs(transform.e))
+            # Rounded: the polygon covers whole pixels, and float error
+            # otherwise depends on the window origin
+            area_pixels = round(poly.area / (transform.a * abs(transform.e)))
             
             # Filter by minimum area
             if area_pixels >= MIN_AREA_PIXELS:
                 # Calculate confidence based on darkness and size
                 confidence = min(0.95, 0.5 + (area_pixels / 500) * 0.3)
                 
-                # Convert to geographic coordinates (rough estimate)
-                area_km2 = area_pixels * (transform.a * abs(transform.e)) / 1e6
+                if crs is not None and crs.is_projected:
+                    area_km2 = _projected_area_m2(poly, crs) / 1e6
+                else:
+                    # Convert to geographic coordinates (rough estimate)
+                    area_km2 = area_pixels * (transform.a * abs(transform.e)) / 1e6
                 
-                features.append({
+                yield {
                     "type": "Feature",
                     "properties": {
-                        "id": feature_id,
+                        "id": next(ids),
                         "area_km2": round(area_km2, 2),
                         "confidence": round(confidence, 2)
                     },
                     "geometry": mapping(poly)
-                })
-                feature_id += 1
-    
-    return {
-        "aoi": "Toronto Harbour",
-        "slick_count": len(features),
-        "features": features[:10]  # Limit to top 10 detections
-    }
+                }
+
+
+def _projected_area_m2(poly, crs):
+    """
+    Ground area of a polygon in a metre-based projected CRS.
+    Web Mercator inflates areas by 1/cos^2(lat), so that is undone at
+    the polygon's centroid latitude.
+    """
+    area = poly.area
+    if crs == MERCATOR_CRS:
+        lat = 2 * math.atan(math.exp(poly.centroid.y / EARTH_RADIUS_M)) - math.pi / 2
+        area *= math.cos(lat) ** 2
+    return area
+
+
+def _window_extent(win):
+    """Return (row0, col0, row1, col1) pixel extent of a window."""
+    return (
+        win.row_off,
+        win.col_off,
+        win.row_off + win.height,
+        win.col_off + win.width,
+    )
+
+
+def _clip_window(src, row0, col0, row1, col1):
+    """Build a window from pixel extents, clipped to the raster."""
+    row0, col0 = max(0, row0), max(0, col0)
+    row1, col1 = min(src.height, row1), min(src.width, col1)
+    return Window(col0, row0, col1 - col0, row1 - row0)
+
+
+def _merge_windows(windows):
+    """
+    Merge overlapping or touching windows so no slick is read
+    (and reported) twice.
+    """
+    extents = [_window_extent(win) for win in windows]
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for ext in extents:
+            for idx, other in enumerate(result):
+                if (ext[0] <= other[2] and other[0] <= ext[2]
+                        and ext[1] <= other[3] and other[1] <= ext[3]):
+                    result[idx] = (
+                        min(ext[0], other[0]),
+                        min(ext[1], other[1]),
+                        max(ext[2], other[2]),
+                        max(ext[3], other[3]),
+                    )
+                    merged = True
+                    break
+            else:
+                result.append(ext)
+        extents = result
+    return [Window(c0, r0, c1 - c0, r1 - r0) for r0, c0, r1, c1 in extents]
 
 
 def _generate_demo_slicks():
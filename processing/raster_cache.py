@@ -0,0 +1,378 @@
+"""
+processing/raster_cache.py
+
+Per-scene cache of derived raster statistics.
+Entries are keyed by a file fingerprint (path, mtime, size), so
+replacing a scene on disk invalidates everything computed from it.
+Results are kept in memory and mirrored to CACHE_DIR so separate
+worker processes (see batch.py) share them. Screening reads block-minimum
+overviews, and map-facing code reads Web Mercator copies of scenes, both
+built here once per fingerprint. Building an entry for a new version of
+a scene evicts everything cached for its older versions, so the cache
+holds one version per scene path.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+# Lazy import for optional dependency
+try:
+    import rasterio
+    from rasterio.crs import CRS
+    from rasterio.enums import Resampling
+    from rasterio.vrt import WarpedVRT
+    from rasterio.warp import calculate_default_transform
+    from rasterio.windows import Window
+    from affine import Affine
+    RASTERIO_AVAILABLE = True
+except ImportError:
+    RASTERIO_AVAILABLE = False
+
+HIST_BINS = 4096             # Histogram resolution between band min and max
+CHUNK_PIXELS = 4_000_000     # Approximate pixels read per streaming chunk
+CACHE_DIR = "data/.cache"    # Shared on-disk cache; set to None to disable
+MERCATOR_CRS = "EPSG:3857"
+WARP_BLOCK = 512             # Tile size of warped rasters (pixels)
+
+# fingerprint + band -> histogram dict
+_histograms = {}
+# fingerprint + band + factor -> block-minimum overview array
+_min_overviews = {}
+_warp_locks = {}
+_warp_locks_lock = threading.Lock()
+
+
+def scene_fingerprint(path):
+    """
+    Identify a scene file by absolute path, modification time and size.
+
+    Args:
+        path: Path to the raster file
+
+    Returns:
+        tuple: Hashable fingerprint
+    """
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def get_histogram(src, bidx=1):
+    """
+    Streaming histogram of one band, cached per scene.
+
+    The band is read in row chunks: one pass for min/max, one pass to
+    accumulate HIST_BINS counts. Nodata and NaN pixels are ignored.
+
+    Args:
+        src: Open rasterio dataset
+        bidx: Band index
+
+    Returns:
+        dict: {"counts": np.ndarray, "min": float, "max": float}
+    """
+    key = (scene_fingerprint(src.name), bidx)
+    if key not in _histograms:
+        _evict_stale(key[0])
+        cache_path = cache_file(key[0], f"hist{bidx}.npz")
+        data = _read_npz(cache_path, ("counts", "min", "max"))
+        if data is None:
+            hist = _compute_histogram(src, bidx)
+            _write_npz(cache_path, **hist)
+        else:
+            hist = {"counts": data["counts"], "min": float(data["min"]),
+                    "max": float(data["max"])}
+        _histograms[key] = hist
+    return _histograms[key]
+
+
+def get_min_overview(src, factor, bidx=1):
+    """
+    Overview holding the minimum of each factor x factor block, cached
+    per scene.
+
+    Building it reads every full-resolution pixel once; later calls for
+    the same scene version are served from memory or CACHE_DIR. The
+    last row and column of blocks may be partial, and blocks with no
+    valid pixels are NaN.
+
+    Args:
+        src: Open rasterio dataset
+        factor: Decimation factor
+        bidx: Band index
+
+    Returns:
+        np.ndarray: float64 array of ceil(height / factor) x
+            ceil(width / factor)
+    """
+    key = (scene_fingerprint(src.name), bidx, factor)
+    if key not in _min_overviews:
+        _evict_stale(key[0])
+        cache_path = cache_file(key[0], f"min{factor}b{bidx}.npz")
+        data = _read_npz(cache_path, ("overview",))
+        if data is None:
+            overview = _compute_min_overview(src, factor, bidx)
+            _write_npz(cache_path, overview=overview)
+        else:
+            overview = data["overview"]
+        _min_overviews[key] = overview
+    return _min_overviews[key]
+
+
+def _compute_min_overview(src, factor, bidx):
+    # Min resampling is only available to the warper, so the overview
+    # is read through a WarpedVRT on the source CRS with a coarser grid
+    with WarpedVRT(
+        src,
+        crs=src.crs,
+        transform=src.transform * Affine.scale(factor),
+        width=-(-src.width // factor),
+        height=-(-src.height // factor),
+        resampling=Resampling.min,
+        nodata=np.nan,
+        dtype="float64",
+    ) as vrt:
+        return vrt.read(bidx)
+
+
+def get_mercator_raster(path):
+    """
+    Path of a Web Mercator (EPSG:3857) copy of a scene, built on first use.
+
+    The copy keeps roughly the source pixel count, is tiled, and is
+    warped one WARP_BLOCK window at a time through a WarpedVRT, so the
+    source is never read whole. Pixels outside the source footprint
+    are nodata (NaN for float rasters).
+
+    Args:
+        path: Source raster path
+
+    Returns:
+        str: Path of the warped GeoTIFF (the source itself if it is
+            already in EPSG:3857)
+    """
+    fingerprint = scene_fingerprint(path)
+    with rasterio.open(path) as src:
+        if src.crs == CRS.from_string(MERCATOR_CRS):
+            return path
+
+    warped_path = cache_file(fingerprint, "3857.tif")
+    if warped_path is None:
+        raise ValueError("CACHE_DIR must be set to build warped rasters")
+
+    with _warp_locks_lock:
+        lock = _warp_locks.setdefault(warped_path, threading.Lock())
+    with lock:
+        if not os.path.exists(warped_path):
+            _evict_stale(fingerprint)
+            _warp_to_mercator(path, warped_path)
+    return warped_path
+
+
+def _warp_to_mercator(path, warped_path):
+    os.makedirs(os.path.dirname(warped_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(warped_path), suffix=".tif")
+    os.close(fd)
+    try:
+        with rasterio.open(path) as src:
+            transform, width, height = calculate_default_transform(
+                src.crs, MERCATOR_CRS, src.width, src.height, *src.bounds
+            )
+            is_float = np.dtype(src.dtypes[0]).kind == "f"
+            nodata = np.nan if is_float else src.nodata
+            profile = src.profile.copy()
+            profile.update(
+                driver="GTiff",
+                crs=MERCATOR_CRS,
+                transform=transform,
+                width=width,
+                height=height,
+                nodata=nodata,
+                tiled=True,
+                blockxsize=WARP_BLOCK,
+                blockysize=WARP_BLOCK,
+            )
+            with WarpedVRT(
+                src,
+                crs=MERCATOR_CRS,
+                transform=transform,
+                width=width,
+                height=height,
+                nodata=nodata,
+                resampling=Resampling.nearest,
+            ) as vrt, rasterio.open(tmp_path, "w", **profile) as dst:
+                for _, win in dst.block_windows(1):
+                    dst.write(vrt.read(window=win), window=win)
+        # Rename into place so other processes never see a partial file
+        os.replace(tmp_path, warped_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def cache_file(fingerprint, suffix):
+    """
+    Path of a derived file for a scene in CACHE_DIR, named
+    "<path digest>-<version digest>.<suffix>" so files left by older
+    versions of the same scene can be found by _evict_stale().
+
+    Args:
+        fingerprint: Result of scene_fingerprint()
+        suffix: File name suffix identifying the product
+
+    Returns:
+        str or None: None when the disk cache is disabled
+    """
+    if not CACHE_DIR:
+        return None
+    return os.path.join(CACHE_DIR, f"{_cache_prefix(fingerprint)}{_digest(fingerprint[1:])}.{suffix}")
+
+
+def _cache_prefix(fingerprint):
+    """File name prefix shared by every version of a scene path."""
+    return _digest(fingerprint[0]) + "-"
+
+
+def _digest(value):
+    return hashlib.sha1(repr(value).encode()).hexdigest()[:12]
+
+
+def _evict_stale(fingerprint):
+    """
+    Drop in-memory entries and CACHE_DIR files for other versions of
+    the scene at fingerprint's path.
+    """
+    path = fingerprint[0]
+    for cache in (_histograms, _min_overviews):
+        for key in list(cache):
+            if key[0][0] == path and key[0] != fingerprint:
+                cache.pop(key, None)
+
+    if not CACHE_DIR or not os.path.isdir(CACHE_DIR):
+        return
+    prefix = _cache_prefix(fingerprint)
+    current = os.path.basename(cache_file(fingerprint, ""))
+    stale = [name for name in os.listdir(CACHE_DIR)
+             if name.startswith(prefix) and not name.startswith(current)]
+    with _warp_locks_lock:
+        for name in stale:
+            _warp_locks.pop(os.path.join(CACHE_DIR, name), None)
+    for name in stale:
+        try:
+            os.remove(os.path.join(CACHE_DIR, name))
+        except OSError:
+            pass  # Already removed by another process
+
+
+def _read_npz(cache_path, names):
+    """Named arrays from a cache file, or None if missing or unreadable."""
+    if not cache_path or not os.path.exists(cache_path):
+        return None
+    try:
+        with np.load(cache_path) as data:
+            return {name: data[name] for name in names}
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Warning: ignoring unreadable cache file {cache_path}: {e}")
+        return None
+
+
+def _write_npz(cache_path, **arrays):
+    if not cache_path:
+        return
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".npz")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Warning: could not write cache file {cache_path}: {e}")
+
+
+def percentile_bounds(hist, low=0.0, high=100.0):
+    """
+    Normalization bounds from a cached histogram.
+
+    Percentiles 0 and 100 return the exact band min and max; anything
+    in between is interpolated within the matching histogram bin.
+
+    Args:
+        hist: Histogram dict from get_histogram()
+        low: Lower percentile (0-100)
+        high: Upper percentile (0-100)
+
+    Returns:
+        tuple: (low_value, high_value)
+    """
+    check_percentiles(low, high)
+    return _percentile(hist, low), _percentile(hist, high)
+
+
+def check_percentiles(low, high):
+    """Raise ValueError unless 0 <= low < high <= 100."""
+    if not 0.0 <= low < high <= 100.0:
+        raise ValueError(f"Invalid percentile range ({low}, {high})")
+
+
+def _percentile(hist, q):
+    if q <= 0.0:
+        return hist["min"]
+    if q >= 100.0:
+        return hist["max"]
+
+    counts = hist["counts"]
+    cumulative = np.cumsum(counts)
+    total = cumulative[-1]
+    if total == 0:
+        return hist["min"]
+
+    target = q / 100.0 * total
+    idx = int(np.searchsorted(cumulative, target))
+    below = cumulative[idx - 1] if idx > 0 else 0
+    fraction = (target - below) / counts[idx] if counts[idx] else 0.0
+    width = (hist["max"] - hist["min"]) / len(counts)
+    return hist["min"] + (idx + fraction) * width
+
+
+def _compute_histogram(src, bidx):
+    band_min, band_max = np.inf, -np.inf
+    for values in _iter_valid(src, bidx):
+        if values.size:
+            band_min = min(band_min, float(values.min()))
+            band_max = max(band_max, float(values.max()))
+
+    counts = np.zeros(HIST_BINS, dtype=np.int64)
+    if band_min > band_max:
+        # Empty band
+        return {"counts": counts, "min": 0.0, "max": 0.0}
+
+    for values in _iter_valid(src, bidx):
+        counts += np.histogram(values, bins=HIST_BINS, range=(band_min, band_max))[0]
+
+    return {"counts": counts, "min": band_min, "max": band_max}
+
+
+def _iter_valid(src, bidx):
+    """Yield 1D arrays of valid pixels, one row chunk at a time."""
+    for chunk in iter_row_chunks(src, bidx):
+        values = src.read(bidx, window=chunk).ravel()
+        valid = ~np.isnan(values) if values.dtype.kind == "f" else np.ones(values.shape, bool)
+        if src.nodata is not None:
+            valid &= values != src.nodata
+        yield values[valid]
+
+
+def iter_row_chunks(src, bidx=1):
+    """
+    Yield full-width windows of roughly CHUNK_PIXELS pixels, aligned to
+    the band's block height.
+    """
+    block_height = src.block_shapes[bidx - 1][0]
+    rows = max(1, CHUNK_PIXELS // max(1, src.width))
+    rows = max(block_height, rows // block_height * block_height)
+    for row in range(0, src.height, rows):
+        yield Window(0, row, src.width, min(rows, src.height - row))
@@ -5,25 +5,52 @@ Predicts contamination/leakage risk zones based on spatial analysis.
 Can load from GeoJSON or generate risk zones programmatically.
 """
 
+import hashlib
 import json
 import os
+import threading
 import numpy as np
 
 # Lazy import for optional dependency
 try:
-    from shapely.geometry import Point, Polygon, mapping
+    import shapely
+    from shapely.geometry import Point, Polygon, box, mapping
     SHAPELY_AVAILABLE = True
 except ImportError:
     SHAPELY_AVAILABLE = False
 
+try:
+    from processing.features import FeatureTableBuilder
+    from processing.geojson import (
+        iter_geojson_features,
+        iter_object_with_features,
+        page_slice,
+    )
+    from processing.raster_cache import scene_fingerprint
+except ImportError:
+    from features import FeatureTableBuilder
+    from geojson import iter_geojson_features, iter_object_with_features, page_slice
+    from raster_cache import scene_fingerprint
+
 RISK_ZONES_PATH = "data/risk_zones.geojson"
 
+# In-memory zone index, rebuilt when the file fingerprint changes
+_index = None
+_index_key = None
+_index_lock = threading.Lock()
+
 
-def get_risk_zones():
+def get_risk_zones(limit=None, cursor=None, bbox=None):
     """
     Load or generate risk zone polygons with risk scores.
     Returns GeoJSON features for the API contract.
     
+    Args:
+        limit: Maximum features to return (None returns every zone)
+        cursor: "next_cursor" from a previous page
+        bbox: Optional (minx, miny, maxx, maxy); only intersecting
+            zones are returned
+    
     Returns:
         dict: {
             "aoi": str,
@@ -34,49 +61,146 @@ def get_risk_zones():
                     "geometry": {"type": "Polygon", "coordinates": [...]}
                 },
                 ...
-            ]
+            ],
+            "next_cursor": str or None
         }
     """
+    page, members = _risk_zones_page(limit, cursor, bbox)
+    return {**members, "features": list(page.iter_features())}
+
+
+def get_risk_zones_json(limit=None, cursor=None, bbox=None):
+    """
+    Same as get_risk_zones(), encoded straight from the zone table's arrays.
+
+    Returns:
+        str: JSON document
+    """
+    page, members = _risk_zones_page(limit, cursor, bbox)
+    return "".join(iter_object_with_features(members, page.iter_json()))
+
+
+def _risk_zones_page(limit, cursor, bbox):
+    """Zones on the requested page and the response's other members."""
     try:
-        if os.path.exists(RISK_ZONES_PATH):
-            return _load_risk_zones_from_file()
-        else:
-            print(f"Info: {RISK_ZONES_PATH} not found. Generating demo risk zones...")
-            return _generate_demo_risk_zones()
+        index = _current_index()
     except Exception as e:
         print(f"Error loading risk zones: {e}")
-        return _generate_demo_risk_zones()
+        index = _build_index(_generate_demo_risk_zones()["features"])
+    table = _query_index(index, bbox)
+    
+    # Cursors are tied to the loaded file and bbox, so a reload or a
+    # different bbox between pages is rejected instead of skipping zones
+    version = hashlib.sha1(repr((index["source"], bbox)).encode()).hexdigest()[:12]
+    rows, next_cursor = page_slice(len(table), limit=limit, cursor=cursor,
+                                   version=version)
+    return table.take(rows), {"aoi": "Peel Region Catchment Area", "next_cursor": next_cursor}
+
+
+def iter_risk_zones(bbox=None):
+    """
+    Yield risk zone features one at a time as encoded GeoJSON text,
+    ready for geojson.iter_ndjson() / iter_feature_collection().
+    
+    Args:
+        bbox: Optional (minx, miny, maxx, maxy) filter
+    """
+    return query_risk_zones(bbox).iter_json()
+
+
+def query_risk_zones(bbox=None):
+    """
+    Risk zones as a FeatureTable, optionally limited to zones
+    intersecting bbox. Falls back to demo zones if the file is missing.
+    
+    Returns:
+        FeatureTable: Columns "name", "risk_score" and "category"
+    """
+    return _query_index(_current_index(), bbox)
+
+
+def _current_index():
+    """Index of RISK_ZONES_PATH, or of the demo zones if the file is missing."""
+    if os.path.exists(RISK_ZONES_PATH):
+        return _get_index()
+    print(f"Info: {RISK_ZONES_PATH} not found. Generating demo risk zones...")
+    return _build_index(_generate_demo_risk_zones()["features"])
+
+
+def _get_index():
+    """
+    Return the zone index for RISK_ZONES_PATH, reloading it only when
+    the file's fingerprint (path, mtime, size) changes.
+    """
+    global _index, _index_key
+    key = scene_fingerprint(RISK_ZONES_PATH)
+    with _index_lock:
+        if _index_key != key:
+            _index = _load_risk_zones_from_file()
+            _index["source"] = key
+            _index_key = key
+        return _index
 
 
 def _load_risk_zones_from_file():
     """
-    Load risk zones from GeoJSON file and ensure proper structure.
+    Stream risk zones from the GeoJSON file into a compact index.
+    Features are parsed one at a time and only the properties the API
+    needs are kept.
+    """
+    return _build_index(iter_geojson_features(RISK_ZONES_PATH))
+
+
+def _build_index(features):
+    """
+    Build the zone index from raw GeoJSON features.
+    
+    Returns:
+        dict: {"table": FeatureTable, "bboxes": np.ndarray of shape (n, 4),
+            "source": file fingerprint, or "demo" until set by _get_index()}
     """
-    with open(RISK_ZONES_PATH, 'r') as f:
-        data = json.load(f)
+    builder = FeatureTableBuilder()
     
-    features = []
-    for idx, feature in enumerate(data.get('features', [])):
-        properties = feature.get('properties', {})
+    for idx, feature in enumerate(features):
+        properties = feature.get('properties') or {}
         
         # Ensure required properties exist
-        risk_score = properties.get('risk_score', 0.5)
-        category = _categorize_risk(risk_score)
-        
-        features.append({
-            "type": "Feature",
-            "properties": {
-                "name": properties.get('name', f"Zone {idx + 1}"),
-                "risk_score": round(risk_score, 2),
-                "category": category
-            },
-            "geometry": feature.get('geometry')
-        })
+        risk_score = round(float(properties.get('risk_score', 0.5)), 2)
+        try:
+            builder.append(
+                feature.get('geometry'),
+                name=properties.get('name', f"Zone {idx + 1}"),
+                risk_score=risk_score,
+                category=_categorize_risk(risk_score),
+            )
+        except ValueError as e:
+            print(f"Warning: skipping risk zone {idx + 1}: {e}")
     
-    return {
-        "aoi": "Peel Region Catchment Area",
-        "features": features
-    }
+    table = builder.build(dtypes={"risk_score": "float64"}, categorical=("category",))
+    return {"table": table, "bboxes": table.bboxes, "source": "demo"}
+
+
+def _query_index(index, bbox=None):
+    """
+    Select zones intersecting bbox: a vectorized bounding-box test over
+    the index, then an exact geometry test on the survivors.
+    """
+    table = index["table"]
+    if bbox is None:
+        return table
+    
+    minx, miny, maxx, maxy = bbox
+    bboxes = index["bboxes"]
+    hits = (
+        (bboxes[:, 0] <= maxx) & (bboxes[:, 2] >= minx)
+        & (bboxes[:, 1] <= maxy) & (bboxes[:, 3] >= miny)
+    )
+    candidates = table.take(hits)
+    if SHAPELY_AVAILABLE and len(candidates):
+        candidates = candidates.take(
+            shapely.intersects(candidates.to_shapely(), box(*bbox))
+        )
+    return candidates
 
 
 def _generate_demo_risk_zones():
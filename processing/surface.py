@@ -7,13 +7,23 @@ and returns metrics & bounds for the AOI.
 
 import numpy as np
 
+# Lazy import for optional dependency
+try:
+    import rasterio
+    RASTERIO_AVAILABLE = True
+except ImportError:
+    RASTERIO_AVAILABLE = False
+
 NDWI_PATH = "data/ndwi_lake.tif"
 
-def get_surface_health():
+def get_surface_health(path=None):
     """
     Load NDWI raster, calculate water mask, healthy mask,
     and return metrics & bounds for the API contract.
     
+    Args:
+        path: NDWI GeoTIFF to analyse (defaults to NDWI_PATH)
+    
     Returns:
         dict: {
             "aoi": str,
@@ -26,12 +36,17 @@ def get_surface_health():
             "overlay_url": str
         }
     """
+    path = path or NDWI_PATH
+    if not RASTERIO_AVAILABLE:
+        print("Warning: rasterio not installed.")
+        return {"error": "rasterio not installed"}
+    
     try:
-        with rasterio.open(NDWI_PATH) as src:
+        with rasterio.open(path) as src:
             ndwi = src.read(1)
             bounds = src.bounds
-    except FileNotFoundError:
-        print(f"Error: {NDWI_PATH} not found. Check data/ folder.")
+    except (FileNotFoundError, rasterio.errors.RasterioIOError):
+        print(f"Error: {path} not found. Check data/ folder.")
         return {"error": "NDWI file not found"}
 
     water_mask = ndwi > 0.1
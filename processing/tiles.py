@@ -0,0 +1,326 @@
+"""
+processing/tiles.py
+
+Mapbox Vector Tile (MVT 2.1) encoding of FeatureTables.
+
+Features are selected by bounding box, projected to Web Mercator and
+quantized to tile coordinates, and their geometry command streams are
+built and varint-encoded for the whole layer in a few array passes, so
+no per-vertex Python objects are created. Only properties go through
+Python values, once per feature.
+"""
+
+import numpy as np
+
+# Lazy import for optional dependency
+try:
+    import shapely
+    SHAPELY_AVAILABLE = True
+except ImportError:
+    SHAPELY_AVAILABLE = False
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+EXTENT = 4096                 # Tile coordinate range per axis
+BUFFER = 64                   # Tile units kept outside the edges when clipping
+MAX_ZOOM = 24
+EARTH_RADIUS = 6378137.0      # Web Mercator sphere (metres)
+ORIGIN = np.pi * EARTH_RADIUS  # Half the projected world width (metres)
+MAX_LATITUDE = 85.0511287798  # Web Mercator latitude limit (degrees)
+
+# Geometry commands (id | count << 3)
+_MOVE_TO = 1 | 1 << 3
+_CLOSE_PATH = 7 | 1 << 3
+_LINE_TO = 2
+
+
+def tile_bounds(z, x, y):
+    """
+    Web Mercator (EPSG:3857) bounds of a tile.
+
+    Returns:
+        tuple: (minx, miny, maxx, maxy) in metres
+
+    Raises:
+        ValueError: If z/x/y is outside the tile pyramid
+    """
+    check_tile(z, x, y)
+    size = 2 * ORIGIN / 2 ** z
+    minx = -ORIGIN + x * size
+    maxy = ORIGIN - y * size
+    return (minx, maxy - size, minx + size, maxy)
+
+
+def tile_bbox(z, x, y):
+    """Longitude/latitude bounds of a tile as (minx, miny, maxx, maxy)."""
+    minx, miny, maxx, maxy = tile_bounds(z, x, y)
+    lon = np.degrees(np.array([minx, maxx]) / EARTH_RADIUS)
+    lat = np.degrees(2 * np.arctan(np.exp(np.array([miny, maxy]) / EARTH_RADIUS)) - np.pi / 2)
+    return (float(lon[0]), float(lat[0]), float(lon[1]), float(lat[1]))
+
+
+def check_tile(z, x, y):
+    """Raise ValueError unless z/x/y names a tile of the pyramid."""
+    if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        raise ValueError(f"Invalid tile {z}/{x}/{y}")
+
+
+def encode_tile(layers, z, x, y, extent=EXTENT):
+    """
+    Encode one vector tile.
+
+    Args:
+        layers: dict of layer name -> FeatureTable with EPSG:4326
+            coordinates; features outside the tile are skipped
+        z, x, y: Tile address (XYZ scheme, y down)
+        extent: Tile coordinate range per axis
+
+    Returns:
+        bytes: Protobuf-encoded tile (empty layers are omitted)
+
+    Raises:
+        ValueError: If z/x/y is outside the tile pyramid
+    """
+    bounds = tile_bounds(z, x, y)
+    bbox = tile_bbox(z, x, y)
+    margin = BUFFER / extent
+    width, height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    query = (bbox[0] - width * margin, bbox[1] - height * margin,
+             bbox[2] + width * margin, bbox[3] + height * margin)
+
+    tile = bytearray()
+    for name, table in layers.items():
+        layer = _encode_layer(name, table, query, bounds, extent)
+        if layer:
+            tile += _field(3, layer)
+    return bytes(tile)
+
+
+def _encode_layer(name, table, query, bounds, extent):
+    """Layer message bytes, or None if no feature reaches the tile."""
+    bboxes = table.bboxes
+    rows = np.flatnonzero(
+        (bboxes[:, 0] <= query[2]) & (bboxes[:, 2] >= query[0])
+        & (bboxes[:, 1] <= query[3]) & (bboxes[:, 3] >= query[1])
+    )
+    if not len(rows):
+        return None
+    table = table.take(rows)
+
+    coords = _to_tile(table.coords, bounds, extent)
+    offsets = (table.ring_offsets, table.polygon_offsets, table.geometry_offsets)
+    rows = np.arange(len(table))
+    if SHAPELY_AVAILABLE:
+        rows, coords, offsets = _clip(coords, offsets, extent)
+        if not len(rows):
+            return None
+
+    streams, kept = _geometry_streams(np.round(coords).astype(np.int64), *offsets)
+
+    keys, values = {}, {}
+    names = list(table.columns)
+    columns = [table.column(column)[rows].tolist() for column in names]
+    features = bytearray()
+    for index, geometry in enumerate(streams):
+        if not kept[index]:
+            continue
+        tags = []
+        for column, column_values in zip(names, columns):
+            value = column_values[index]
+            if value is None:
+                continue
+            tags.append(keys.setdefault(column, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        feature = _field(2, _packed(tags)) + b"\x18\x03" + _field(4, geometry)
+        features += _field(2, feature)
+    if not features:
+        return None
+
+    layer = bytearray(b"\x78\x02")  # version = 2
+    layer += _field(1, name.encode())
+    layer += features
+    for key in keys:
+        layer += _field(3, key.encode())
+    for _, value in values:
+        layer += _field(4, _encode_value(value))
+    layer += b"\x28" + _varint(extent)
+    return bytes(layer)
+
+
+def _to_tile(lonlat, bounds, extent):
+    """Project lon/lat to Web Mercator and scale into tile units (y down)."""
+    lon = lonlat[:, 0]
+    lat = np.clip(lonlat[:, 1], -MAX_LATITUDE, MAX_LATITUDE)
+    mx = EARTH_RADIUS * np.radians(lon)
+    my = EARTH_RADIUS * np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+    minx, miny, maxx, maxy = bounds
+    return np.column_stack((
+        (mx - minx) * (extent / (maxx - minx)),
+        (maxy - my) * (extent / (maxy - miny)),
+    ))
+
+
+def _clip(coords, offsets, extent):
+    """
+    Clip features to the buffered tile in tile space.
+
+    Returns:
+        tuple: (rows, coords, offsets) where rows are the input features
+            still present after clipping, and offsets is (ring_offsets,
+            polygon_offsets, geometry_offsets) of the clipped features
+    """
+    geometries = shapely.from_ragged_array(shapely.GeometryType.MULTIPOLYGON, coords, offsets)
+    clipped = shapely.clip_by_rect(geometries, -BUFFER, -BUFFER, extent + BUFFER, extent + BUFFER)
+    polygonal = np.isin(shapely.get_type_id(clipped), (3, 6))  # Polygon, MultiPolygon
+    rows = np.flatnonzero(polygonal & ~shapely.is_empty(clipped))
+    if not len(rows):
+        return rows, None, None
+    geometry_type, coords, offsets = shapely.to_ragged_array(clipped[rows])
+    if geometry_type == shapely.GeometryType.POLYGON:
+        # Every feature is a single Polygon: one polygon per feature
+        offsets = (*offsets, np.arange(len(rows) + 1))
+    return rows, coords, offsets
+
+
+def _geometry_streams(coords, ring_offsets, polygon_offsets, geometry_offsets):
+    """
+    Varint-encoded MVT geometry per feature.
+
+    Rings lose their closing vertex and repeated vertices; rings with
+    under three vertices or zero area are dropped (holes with their
+    exterior), and winding is fixed to exterior positive, holes negative
+    as the spec requires.
+
+    Returns:
+        tuple: (list of bytes per feature, bool array of non-empty features)
+    """
+    n_rings = len(ring_offsets) - 1
+    n_features = len(geometry_offsets) - 1
+    ring_of_vertex = np.repeat(np.arange(n_rings), np.diff(ring_offsets))
+    starts = ring_offsets[:-1]
+
+    # Drop closing and consecutive duplicate vertices
+    same_as_previous = np.zeros(len(coords), bool)
+    same_as_previous[1:] = (coords[1:] == coords[:-1]).all(axis=1)
+    same_as_previous[starts[np.diff(ring_offsets) > 0]] = False
+    keep = ~same_as_previous
+    ends = ring_offsets[1:] - 1
+    filled = ends > starts
+    closing = np.zeros(n_rings, bool)
+    closing[filled] = (coords[ends[filled]] == coords[starts[filled]]).all(axis=1)
+    keep[ends[closing]] = False
+    coords = coords[keep]
+    ring_of_vertex = ring_of_vertex[keep]
+    counts = np.bincount(ring_of_vertex, minlength=n_rings)
+    ring_offsets = np.concatenate(([0], np.cumsum(counts)))
+    starts = ring_offsets[:-1]
+
+    # Signed area in tile space (y down: clockwise on screen is positive)
+    following = np.arange(len(coords)) + 1
+    last = ring_offsets[1:] - 1
+    following[last[counts > 0]] = starts[counts > 0]
+    cross = coords[:, 0] * coords[following, 1] - coords[following, 0] * coords[:, 1]
+    area = np.zeros(n_rings)
+    np.add.at(area, ring_of_vertex, cross)
+
+    polygon_of_ring = np.repeat(np.arange(len(polygon_offsets) - 1), np.diff(polygon_offsets))
+    exterior = np.zeros(n_rings, bool)
+    exterior[polygon_offsets[:-1][np.diff(polygon_offsets) > 0]] = True
+    valid = (counts >= 3) & (area != 0)
+    polygon_valid = np.zeros(len(polygon_offsets) - 1, bool)
+    polygon_valid[polygon_of_ring[exterior]] = valid[exterior]
+    valid &= polygon_valid[polygon_of_ring]
+
+    # Reverse rings wound the wrong way
+    reverse = valid & ((exterior & (area < 0)) | (~exterior & (area > 0)))
+    order = np.arange(len(coords))
+    flip = reverse[ring_of_vertex]
+    order[flip] = (starts + last)[ring_of_vertex[flip]] - order[flip]
+    coords = coords[order]
+
+    # Emitted vertices, and the feature each one belongs to
+    emitted = valid[ring_of_vertex]
+    feature_of_ring = np.repeat(np.arange(n_features), np.diff(polygon_offsets[geometry_offsets]))
+    vertex_feature = feature_of_ring[ring_of_vertex][emitted]
+    points = coords[emitted]
+    ring_ids = ring_of_vertex[emitted]
+
+    # Cursor deltas reset at the start of every feature
+    deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), np.int64))
+    first_of_feature = np.ones(len(points), bool)
+    first_of_feature[1:] = vertex_feature[1:] != vertex_feature[:-1]
+    deltas[first_of_feature] = points[first_of_feature]
+    zigzag = ((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)
+
+    # Command stream: MoveTo, x, y, LineTo(n - 1), 2(n - 1) values, ClosePath
+    emitted_rings = np.flatnonzero(valid)
+    ring_counts = counts[emitted_rings]
+    ring_lengths = 2 * ring_counts + 3
+    ring_base = np.concatenate(([0], np.cumsum(ring_lengths)))
+    stream = np.empty(int(ring_base[-1]), np.uint64)
+    stream[ring_base[:-1]] = _MOVE_TO
+    stream[ring_base[:-1] + 3] = _LINE_TO | (ring_counts - 1).astype(np.uint64) << np.uint64(3)
+    stream[ring_base[1:] - 1] = _CLOSE_PATH
+    ring_index = np.repeat(np.arange(len(emitted_rings)), ring_counts)
+    first_vertex = np.concatenate(([0], np.cumsum(ring_counts)))[:-1]
+    position = np.arange(len(points)) - first_vertex[ring_index]
+    # The first vertex follows MoveTo, the rest follow the LineTo header
+    slot = ring_base[:-1][ring_index] + 1 + 2 * position + (position > 0)
+    stream[slot] = zigzag[:, 0]
+    stream[slot + 1] = zigzag[:, 1]
+
+    encoded, value_offsets = _varints(stream)
+    feature_rings = np.bincount(feature_of_ring[emitted_rings], minlength=n_features)
+    ring_bounds = np.concatenate(([0], np.cumsum(feature_rings)))
+    byte_bounds = value_offsets[ring_base[ring_bounds]].tolist()
+    streams = [encoded[byte_bounds[i]:byte_bounds[i + 1]] for i in range(n_features)]
+    return streams, feature_rings > 0
+
+
+def _varints(values):
+    """
+    Varint-encode a uint64 array.
+
+    Returns:
+        tuple: (bytes, offsets) where value i starts at offsets[i]
+    """
+    values = values.astype(np.uint64)
+    lengths = np.ones(len(values), np.int64)
+    for shift in range(7, 64, 7):
+        lengths += values >= np.uint64(1) << np.uint64(shift)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    out = np.empty(int(offsets[-1]), np.uint8)
+    for k in range(int(lengths.max(initial=0))):
+        present = lengths > k
+        byte = (values[present] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        byte |= np.where(lengths[present] > k + 1, np.uint64(0x80), np.uint64(0))
+        out[offsets[:-1][present] + k] = byte
+    return out.tobytes(), offsets
+
+
+def _varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _field(number, payload):
+    """Length-delimited protobuf field."""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _packed(values):
+    return b"".join(_varint(value) for value in values)
+
+
+def _encode_value(value):
+    """Layer Value message for a property value."""
+    if isinstance(value, bool):
+        return b"\x38" + _varint(int(value))
+    if isinstance(value, int):
+        return b"\x30" + _varint(((value << 1) ^ (value >> 63)) & ((1 << 64) - 1))
+    if isinstance(value, float):
+        return b"\x19" + np.float64(value).tobytes()
+    return _field(1, str(value).encode())
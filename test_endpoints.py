@@ -43,6 +43,35 @@ def test_endpoint(name, url):
         return False
 
 
+def test_bad_stream_format(attempts=12):
+    """
+    A rejected stream request must not keep an oil-slicks admission slot:
+    more bad requests than there are slots, then a real stream.
+    """
+    name = "Oil Slick Stream (bad format)"
+    print(f"\n{'='*60}")
+    print(f"Testing: {name}")
+    print(f"{'='*60}")
+    
+    url = f"{BASE_URL}/api/oil-slicks/stream"
+    try:
+        for _ in range(attempts):
+            response = requests.get(url, params={"format": "xml"}, timeout=5)
+            if response.status_code != 400:
+                print(f"❌ Expected 400 for format=xml, got {response.status_code}")
+                return False
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        print(f"✅ {attempts} bad requests rejected; stream still admitted")
+        return True
+    except requests.exceptions.ConnectionError:
+        print("❌ Connection Error: Server not running?")
+        return False
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return False
+
+
 def main():
     print("🌊 HydroSentinel API Endpoint Tests")
     print("="*60)
@@ -57,6 +86,7 @@ def main():
     results = []
     for name, url in endpoints:
         results.append(test_endpoint(name, url))
+    results.append(test_bad_stream_format())
     
     # Summary
     print(f"\n{'='*60}")